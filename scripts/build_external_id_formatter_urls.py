@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.wiki_queries as wq  # noqa:  E402
+
+# build the {property id: formatter url} index that format_display_item uses
+# to create external id links without a sparql query for every item
+data = wq.save_external_id_formatter_urls()
+print(f"{len(data)} formatter urls saved to {wq.EXTERNAL_ID_FORMATTER_URLS_PATH}")
@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+import pywikibot
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.bulk_import as bulk_import  # noqa:  E402
+import scripts.utils.import_planner as import_planner  # noqa:  E402
+import scripts.utils.import_wikidata_records as iwr  # noqa:  E402
+
+# import the items in a file of qids, one qid per line, to a local wikibase.
+# Run the same command again to resume an import that stopped.
+parser = argparse.ArgumentParser(description="import wikidata items in bulk")
+parser.add_argument("qids_file", help="file with one qid per line")
+parser.add_argument("local_family", help="pywikibot family of the local wikibase")
+parser.add_argument("local_url", help="url of the local wikibase")
+parser.add_argument("--local-code", default="en")
+parser.add_argument("--journal", default=str(bulk_import.JOURNAL_PATH))
+parser.add_argument("--write-mode", default="entity", choices=iwr.WRITE_MODES)
+parser.add_argument("--batch-size", type=int, default=bulk_import.BATCH_SIZE)
+parser.add_argument("--read-ahead", type=int, default=bulk_import.READ_AHEAD)
+parser.add_argument("--limit-languages", action="store_true")
+parser.add_argument(
+    "--depth",
+    type=int,
+    help="import the items used in the claims first, up to depth levels away",
+)
+args = parser.parse_args()
+
+site = pywikibot.Site("wikidata", "wikidata")
+local_site = pywikibot.Site(args.local_code, args.local_family)
+
+qids = bulk_import.read_qids(args.qids_file)
+kwargs = {
+    "journal_path": args.journal,
+    "write_mode": args.write_mode,
+    "batch_size": args.batch_size,
+    "read_ahead": args.read_ahead,
+    "limit_languages": args.limit_languages,
+}
+if args.depth is None:
+    summary = bulk_import.bulk_import(qids, site, local_site, args.local_url, **kwargs)
+else:
+    summary = import_planner.import_with_dependencies(
+        qids, site, local_site, args.local_url, depth=args.depth, **kwargs
+    )
+print(json.dumps(summary, indent=2))
@@ -0,0 +1,94 @@
+import copy
+from datetime import datetime
+import json
+import sys
+from pathlib import Path
+import pywikibot
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.wiki_json_serialization as wjs  # noqa:  E402
+import scripts.utils.wiki_serialization as ws  # noqa:  E402
+import scripts.utils.wikidata_utils as wd  # noqa:  E402
+
+# compare the display item serialization that uses pywikibot objects
+# (wiki_serialization) with the one that uses the wbgetentities json
+# (wiki_json_serialization) without network access. The items, the results of
+# the remote lookups and the siteinfo pywikibot needs are in scripts/fixtures.
+# usage: python scripts/check_serialization_parity.py
+fixtures_path = parent_path / "scripts" / "fixtures"
+
+
+def load_fixture(name):
+    with open(fixtures_path / name) as f:
+        return json.load(f)
+
+
+def load_offline_sites():
+    """fill the pywikibot siteinfo cache from the fixture, so creating pages
+    and claims does not request the siteinfo"""
+    now = datetime.utcnow()
+    for key, siteinfo in load_fixture("siteinfo.json").items():
+        code, family = key.split(":")
+        site = pywikibot.Site(code, family)
+        site._siteinfo._cache.update(
+            {prop: (value, now) for prop, value in siteinfo.items()}
+        )
+    return pywikibot.Site("wikidata", "wikidata")
+
+
+def compare_item(site, item_json, lookups):
+    """list the differences between the two serializations of an item"""
+    item = pywikibot.ItemPage(site, item_json["id"])
+    item._content = copy.deepcopy(item_json)
+    item.get()
+
+    # pywikibot does not keep the order of the languages, and the order of the
+    # languages is not used, so only the claims are compared in order
+    differences = wjs.find_differences(
+        wd.format_display_item_fields(item.toJSON()),
+        wjs.format_item_fields(item_json),
+        "fields",
+        check_order=False,
+    )
+
+    expected = ws.format_item_claims(
+        item,
+        lookups["id_label_dict"],
+        lookups["media_metadata"],
+        lookups["external_id_links"],
+    )
+    expected["ids"] = sorted(wd.get_ids_for_item(item, item.toJSON()))
+    expected["media"] = sorted(wd.get_commons_media_for_item(item))
+
+    actual = wjs.format_item_claims(
+        item_json,
+        lookups["id_label_dict"],
+        lookups["media_metadata"],
+        lookups["external_id_links"],
+        site,
+    )
+    actual["ids"] = sorted(wjs.get_ids_for_item(item_json))
+    actual["media"] = sorted(wjs.get_commons_media_for_item(item_json))
+
+    return differences + wjs.find_differences(expected, actual)
+
+
+site = load_offline_sites()
+lookups = load_fixture("display_item_lookups.json")
+
+failed = False
+for path in sorted(fixtures_path.glob("wbgetentities_*.json")):
+    for qid, item_json in load_fixture(path.name)["entities"].items():
+        differences = compare_item(site, item_json, lookups)
+        if differences:
+            failed = True
+            print(f"{qid}: {len(differences)} differences")
+            for difference in differences:
+                print("   ", difference)
+        else:
+            print(f"{qid}: same")
+
+sys.exit(1 if failed else 0)
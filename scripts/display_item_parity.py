@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+import pywikibot
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.wiki_json_serialization as wjs  # noqa:  E402
+import scripts.utils.wikidata_utils as wd  # noqa:  E402
+
+# compare format_display_item, which uses pywikibot objects, with
+# fetch_and_format_display_item, which uses the wbgetentities json, for live
+# wikidata items. check_serialization_parity.py does the same check offline.
+# usage: python scripts/display_item_parity.py Q42 Q30
+site = pywikibot.Site("wikidata", "wikidata")
+repo = site.data_repository()
+qids = sys.argv[1:] or ["Q42", "Q30", "Q2"]
+
+failed = False
+for qid in qids:
+    item = pywikibot.ItemPage(repo, qid)
+    item.get()
+    expected = wd.format_display_item(item, site)
+    actual = wd.fetch_and_format_display_item(qid, site)
+
+    # the order of the languages is not used, so only the claims are compared
+    # in order
+    claim_keys = ["statements", "identifiers"]
+    differences = wjs.find_differences(
+        {key: value for key, value in expected.items() if key not in claim_keys},
+        {key: value for key, value in actual.items() if key not in claim_keys},
+        check_order=False,
+    )
+    for key in claim_keys:
+        differences += wjs.find_differences(expected[key], actual[key], key)
+    if differences:
+        failed = True
+        print(f"{qid}: {len(differences)} differences")
+        for difference in differences:
+            print("   ", difference)
+    else:
+        print(f"{qid}: same")
+
+sys.exit(1 if failed else 0)
@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.bulk_import as bulk_import  # noqa:  E402
+import scripts.utils.dump_filter as dump_filter  # noqa:  E402
+
+# write the items in a wikidata json dump that match the filters to a smaller
+# dump that can be imported with import_dump.py
+parser = argparse.ArgumentParser(description="filter a wikidata json dump")
+parser.add_argument("dump", help="wikidata json dump, .json, .json.gz or .json.bz2")
+parser.add_argument("output", help="subset dump, .json, .json.gz or .json.bz2")
+parser.add_argument("--qids-file", help="only keep the qids in the file")
+parser.add_argument(
+    "--class",
+    action="append",
+    dest="classes",
+    help="only keep items that are an instance of (P31) the class; can be repeated",
+)
+parser.add_argument(
+    "--property",
+    action="append",
+    dest="properties",
+    help="only keep items with a claim for the property; can be repeated",
+)
+parser.add_argument("--processes", type=int, help="defaults to the number of cores")
+parser.add_argument("--block-size", type=int, default=dump_filter.BLOCK_SIZE)
+args = parser.parse_args()
+
+qids = bulk_import.read_qids(args.qids_file) if args.qids_file else None
+summary = dump_filter.filter_dump(
+    args.dump,
+    args.output,
+    qids=qids,
+    properties=args.properties,
+    classes=args.classes,
+    processes=args.processes,
+    block_size=args.block_size,
+)
+print(json.dumps(summary, indent=2))
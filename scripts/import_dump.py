@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+import pywikibot
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.bulk_import as bulk_import  # noqa:  E402
+import scripts.utils.import_wikidata_records as iwr  # noqa:  E402
+
+# import items from a wikidata json dump instead of the api. Run the same
+# command again to resume an import that stopped.
+parser = argparse.ArgumentParser(description="import wikidata items from a dump")
+parser.add_argument("dump", help="wikidata json dump, .json, .json.gz or .json.bz2")
+parser.add_argument("local_family", help="pywikibot family of the local wikibase")
+parser.add_argument("local_url", help="url of the local wikibase")
+parser.add_argument("--local-code", default="en")
+parser.add_argument("--qids-file", help="only import the qids in the file")
+parser.add_argument(
+    "--property",
+    action="append",
+    dest="properties",
+    help="only import items with a claim for the property; can be repeated",
+)
+parser.add_argument("--journal", default=str(bulk_import.JOURNAL_PATH))
+parser.add_argument("--write-mode", default="entity", choices=iwr.WRITE_MODES)
+parser.add_argument("--limit-languages", action="store_true")
+args = parser.parse_args()
+
+site = pywikibot.Site("wikidata", "wikidata")
+local_site = pywikibot.Site(args.local_code, args.local_family)
+
+qids = bulk_import.read_qids(args.qids_file) if args.qids_file else None
+summary = bulk_import.bulk_import_from_dump(
+    args.dump,
+    site,
+    local_site,
+    args.local_url,
+    qids=qids,
+    properties=args.properties,
+    journal_path=args.journal,
+    write_mode=args.write_mode,
+    limit_languages=args.limit_languages,
+)
+print(json.dumps(summary, indent=2))
@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+import pywikibot
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
+
+
+import scripts.utils.bulk_import as bulk_import  # noqa:  E402
+import scripts.utils.item_sync as item_sync  # noqa:  E402
+
+# import the items that changed on wikidata.org since the last sync again.
+# Only the changes are saved to the local wikibase.
+parser = argparse.ArgumentParser(description="sync imported wikidata items")
+parser.add_argument("local_family", help="pywikibot family of the local wikibase")
+parser.add_argument("local_url", help="url of the local wikibase")
+parser.add_argument("--local-code", default="en")
+parser.add_argument(
+    "--qids-file", help="file with one qid per line; defaults to all tracked items"
+)
+parser.add_argument(
+    "--record-only",
+    action="store_true",
+    help="track the current revisions without importing, e.g. for older imports",
+)
+parser.add_argument("--allow-removals", action="store_true")
+parser.add_argument("--journal", default=str(item_sync.SYNC_JOURNAL_PATH))
+parser.add_argument("--limit-languages", action="store_true")
+args = parser.parse_args()
+
+site = pywikibot.Site("wikidata", "wikidata")
+local_site = pywikibot.Site(args.local_code, args.local_family)
+
+qids = bulk_import.read_qids(args.qids_file) if args.qids_file else None
+summary = item_sync.sync_items(
+    site,
+    local_site,
+    args.local_url,
+    qids=qids,
+    record_only=args.record_only,
+    journal_path=args.journal,
+    allow_removals=args.allow_removals,
+    limit_languages=args.limit_languages,
+)
+print(json.dumps(summary, indent=2))
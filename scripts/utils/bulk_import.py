@@ -0,0 +1,379 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import time
+
+import scripts.utils.id_mapping as id_mapping
+import scripts.utils.import_wikidata_records as iwr
+from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
+import scripts.utils.wiki_queries as wq
+import scripts.utils.wikidata_dump as wikidata_dump
+import scripts.utils.wikidata_utils as wd
+
+JOURNAL_PATH = id_mapping.data_dir / "import_journal.jsonl"
+# number of items that are loaded with one wbgetentities request
+BATCH_SIZE = wq.API_MAX_IDS
+# number of batches that are loaded while earlier batches are written
+READ_AHEAD = 2
+# log the throughput after every REPORT_INTERVAL items
+REPORT_INTERVAL = 10
+
+
+def read_qids(path):
+    """read one qid per line. Blank lines and lines that start with # are
+    skipped."""
+    qids = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                qids.append(line)
+    return qids
+
+
+def load_journal(path=JOURNAL_PATH):
+    """get the last journal entry for every qid"""
+    entries = {}
+    if not Path(path).exists():
+        return entries
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line is incomplete if a run stopped while writing it
+                logger.warning(f"Invalid journal line skipped: {line}")
+                continue
+            entries[entry["qid"]] = entry
+    return entries
+
+
+def write_journal_entry(path, entry):
+    """append an entry to the journal. The file is synced after every entry so
+    finished items are not imported again after a crash."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ImportStats:
+    """throughput of a bulk import"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.items = 0
+        self.failed = 0
+        self.skipped = 0
+        self.edits = 0
+        self.requests = 0
+
+    def add(self, entry):
+        if entry["status"] == "done":
+            self.items += 1
+        else:
+            self.failed += 1
+        self.edits += entry.get("edits", 0)
+        self.requests += entry.get("requests", 0)
+
+    def summary(self):
+        minutes = max(time.time() - self.start, 1e-6) / 60
+        return {
+            "items": self.items,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "edits": self.edits,
+            "requests": self.requests,
+            "minutes": round(minutes, 2),
+            "items_per_minute": round(self.items / minutes, 2),
+            "edits_per_minute": round(self.edits / minutes, 2),
+        }
+
+    def __str__(self):
+        data = self.summary()
+        return (
+            f"{data['items']} items, {data['failed']} failed, "
+            f"{data['skipped']} skipped, {data['items_per_minute']} items/min, "
+            f"{data['edits_per_minute']} edits/min"
+        )
+
+
+def read_batch(
+    site, local_repo, qids, max_workers=wq.MAX_WORKERS, items=None, entity_cache=None
+):
+    """read stage: load the items in a batch and the items used in their
+    claims. items ({qid: ItemPage}) and entity_cache ({qid: item_dict}) are
+    optional items that were already loaded; they are not loaded again."""
+    items = items or {}
+    batch_items = {qid: items[qid] for qid in qids if qid in items}
+    missing = [qid for qid in qids if qid not in items]
+    batch_items.update(
+        {item.id: item for item in wd.load_items(site, missing, max_workers)}
+    )
+    # items in the batch that use each other are not loaded again
+    entity_cache = {
+        **(entity_cache or {}),
+        **{qid: item.get() for qid, item in batch_items.items()},
+    }
+    entity_cache = wd.prefetch_entities(
+        site, local_repo, batch_items.values(), max_workers, entity_cache
+    )
+    return batch_items, entity_cache
+
+
+def import_journal_item(
+    qid, item, entity_cache, site, local_site, local_site_url, **import_kwargs
+):
+    """write stage: import one item and create its journal entry"""
+    start = time.time()
+    try:
+        result = iwr.import_wikidata_item_to_local_wikibase(
+            qid,
+            site,
+            local_site,
+            local_site_url,
+            item=item,
+            entity_cache=entity_cache,
+            **import_kwargs,
+        )
+        entry = {
+            "qid": qid,
+            "status": "done",
+            "local_id": result["id"],
+            "edits": result["api_calls"]["edits"],
+            "requests": result["api_calls"]["total"],
+        }
+    except Exception as err:
+        logger.error(f"Could not import {qid}: {err}")
+        entry = {"qid": qid, "status": "failed", "error": repr(err)}
+
+    entry["duration"] = round(time.time() - start, 3)
+    entry["time"] = time.time()
+    return entry
+
+
+def import_batches(
+    batches,
+    site,
+    local_site,
+    local_site_url,
+    journal_path,
+    stats,
+    read_ahead=READ_AHEAD,
+    max_workers=wq.MAX_WORKERS,
+    entity_cache=None,
+    name="Bulk import",
+    **import_kwargs,
+):
+    """import batches of items with the read stage running ahead of the write
+    stage. batches is an iterable of (qids, items), where items is {qid:
+    ItemPage} for the items in the batch that were already loaded. Up to
+    read_ahead batches are loaded in background threads while the items of
+    earlier batches are written one at a time. The entries are added to the
+    journal and to stats."""
+    local_repo = local_site.data_repository()
+    batches = iter(batches)
+    futures = deque()
+
+    with ThreadPoolExecutor(max_workers=max(read_ahead, 1)) as executor:
+
+        def submit_next_batch():
+            batch, items = next(batches, (None, None))
+            if batch:
+                future = metrics.run_in_context(
+                    executor,
+                    read_batch,
+                    site,
+                    local_repo,
+                    batch,
+                    max_workers,
+                    items,
+                    entity_cache,
+                )
+                futures.append((batch, future))
+
+        for _ in range(max(read_ahead, 1)):
+            submit_next_batch()
+
+        while futures:
+            batch, future = futures.popleft()
+            submit_next_batch()
+
+            try:
+                batch_items, batch_entity_cache = future.result()
+            except Exception as err:
+                logger.error(f"Could not load batch {batch[0]}-{batch[-1]}: {err}")
+                batch_items, batch_entity_cache = {}, {}
+
+            for qid in batch:
+                if qid in batch_items:
+                    entry = import_journal_item(
+                        qid,
+                        batch_items[qid],
+                        batch_entity_cache,
+                        site,
+                        local_site,
+                        local_site_url,
+                        **import_kwargs,
+                    )
+                else:
+                    entry = {
+                        "qid": qid,
+                        "status": "failed",
+                        "error": "item not loaded",
+                        "time": time.time(),
+                    }
+
+                write_journal_entry(journal_path, entry)
+                stats.add(entry)
+
+                if (stats.items + stats.failed) % REPORT_INTERVAL == 0:
+                    logger.info(f"{name}: {stats}")
+
+
+@metrics.timed
+def bulk_import(
+    qids,
+    site,
+    local_site,
+    local_site_url,
+    journal_path=JOURNAL_PATH,
+    write_mode="entity",
+    batch_size=BATCH_SIZE,
+    read_ahead=READ_AHEAD,
+    max_workers=wq.MAX_WORKERS,
+    items=None,
+    entity_cache=None,
+    **import_kwargs,
+):
+    """import many wikidata.org items to the local wikibase.
+
+    Items are loaded in batches of batch_size with the items used in their
+    claims. Up to read_ahead batches are loaded in background threads while
+    the items of earlier batches are written one at a time, so writes still
+    follow the pywikibot put throttle.
+
+    Every imported or failed item is added to the journal at journal_path.
+    Items that are done in the journal are skipped, so an import that stopped
+    can be run again with the same journal. Failed items are tried again.
+    import_kwargs are passed to import_wikidata_item_to_local_wikibase.
+
+    items ({qid: ItemPage}) and entity_cache ({qid: item_dict}) are optional
+    items that were already loaded, e.g. by import_planner.plan_import. They
+    are not loaded again.
+
+    Returns the throughput summary."""
+    journal_path = Path(journal_path)
+    journal = load_journal(journal_path)
+    qids = list(dict.fromkeys(qids))
+    pending = [qid for qid in qids if journal.get(qid, {}).get("status") != "done"]
+
+    stats = ImportStats()
+    stats.skipped = len(qids) - len(pending)
+    logger.info(f"Bulk import: {len(pending)} items, {stats.skipped} already done")
+
+    items = items or {}
+    batches = (
+        (batch, {qid: items[qid] for qid in batch if qid in items})
+        for batch in wq.chunk_list(pending, batch_size)
+    )
+    import_batches(
+        batches,
+        site,
+        local_site,
+        local_site_url,
+        journal_path,
+        stats,
+        read_ahead,
+        max_workers,
+        entity_cache,
+        write_mode=write_mode,
+        **import_kwargs,
+    )
+
+    logger.info(f"Bulk import finished: {stats}")
+    return stats.summary()
+
+
+def read_dump_batches(dump_path, repo, qids, properties, done, stats, batch_size):
+    """generator of (qids, items) for the items in a dump that are not done in
+    the journal. The items are created from the dump json, so they are not
+    loaded from the api."""
+    batch = {}
+    for entity in wikidata_dump.read_dump(dump_path, qids, properties):
+        qid = entity["id"]
+        if qid in done:
+            stats.skipped += 1
+            continue
+
+        batch[qid] = wikidata_dump.create_item_from_entity(repo, entity)
+        if len(batch) >= batch_size:
+            yield list(batch), batch
+            batch = {}
+    if batch:
+        yield list(batch), batch
+
+
+@metrics.timed
+def bulk_import_from_dump(
+    dump_path,
+    site,
+    local_site,
+    local_site_url,
+    qids=None,
+    properties=None,
+    journal_path=JOURNAL_PATH,
+    write_mode="entity",
+    batch_size=BATCH_SIZE,
+    read_ahead=READ_AHEAD,
+    max_workers=wq.MAX_WORKERS,
+    **import_kwargs,
+):
+    """import the items in a wikidata json dump to the local wikibase, filtered
+    by a list of qids and a list of properties. The items are read from the
+    dump instead of the api, in batches of batch_size. The items used in their
+    claims that are not in the batch or the id mapping store are loaded from
+    the api with one wbgetentities request for every 50 items per batch, in
+    background threads like bulk_import. Uses the same journal as bulk_import,
+    so items that are done are skipped.
+
+    Returns the throughput summary."""
+    journal_path = Path(journal_path)
+    journal = load_journal(journal_path)
+    done = {qid for qid, entry in journal.items() if entry["status"] == "done"}
+    stats = ImportStats()
+    if qids is not None:
+        qids = set(qids)
+        stats.skipped = len(qids & done)
+        qids -= done
+
+    logger.info(f"Dump import: {dump_path}, {len(done)} items already done")
+
+    batches = read_dump_batches(
+        dump_path, site.data_repository(), qids, properties, done, stats, batch_size
+    )
+    import_batches(
+        batches,
+        site,
+        local_site,
+        local_site_url,
+        journal_path,
+        stats,
+        read_ahead,
+        max_workers,
+        name="Dump import",
+        write_mode=write_mode,
+        **import_kwargs,
+    )
+
+    logger.info(f"Dump import finished: {stats}")
+    return stats.summary()
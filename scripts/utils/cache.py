@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+if os.environ.get("BASE_DIR"):
+    cache_dir = Path(os.environ.get("BASE_DIR"), "cache")
+else:
+    cache_dir = Path(Path(__file__).parent.parent.parent, "cache")
+
+# sqlite limits the number of variables in a query
+SQLITE_MAX_VARIABLES = 500
+
+
+class MemoryCache:
+    """in-memory least recently used cache. Entries older than ttl seconds are
+    treated as missing. When the cache has more than maxsize entries, the least
+    recently used entries are removed."""
+
+    def __init__(self, maxsize=10000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _is_expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get_entries(self, keys):
+        """get {key: (value, created)} for the keys that are in the cache"""
+        results = {}
+        with self._lock:
+            for key in keys:
+                if key not in self._data:
+                    continue
+
+                value, created = self._data[key]
+                if self._is_expired(created):
+                    del self._data[key]
+                    continue
+
+                self._data.move_to_end(key)
+                results[key] = (value, created)
+        return results
+
+    def get_many(self, keys):
+        return {key: value for key, (value, _) in self.get_entries(keys).items()}
+
+    def set_many(self, data, created=None):
+        created = created or time.time()
+        with self._lock:
+            for key, value in data.items():
+                self._data[key] = (value, created)
+                self._data.move_to_end(key)
+
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """sqlite cache that persists between runs. Values are stored as json.
+    Entries older than ttl seconds are treated as missing. When the cache has
+    more than maxsize entries, the least recently used entries are removed."""
+
+    def __init__(self, path, maxsize=None, ttl=None):
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        # create directory and database if they do not exists
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get_entries(self, keys):
+        """get {key: (value, created)} for the keys that are in the cache"""
+        keys = list(keys)
+        results = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                chunk_keys = keys[i : i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk_keys))
+                query = (
+                    "SELECT key, value, created FROM cache "
+                    f"WHERE key IN ({placeholders})"
+                )
+                rows = self.connection.execute(query, chunk_keys).fetchall()
+                for key, value, created in rows:
+                    if self.ttl is not None and now - created > self.ttl:
+                        continue
+                    results[key] = (json.loads(value), created)
+
+            if results:
+                self.connection.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in results],
+                )
+                self.connection.commit()
+        return results
+
+    def get_many(self, keys):
+        return {key: value for key, (value, _) in self.get_entries(keys).items()}
+
+    def set_many(self, data, created=None):
+        created = created or time.time()
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                [
+                    (key, json.dumps(value), created, created)
+                    for key, value in data.items()
+                ],
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        if self.ttl is not None:
+            self.connection.execute(
+                "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)
+            )
+
+        if self.maxsize is not None:
+            count = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.maxsize:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (count - self.maxsize,),
+                )
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        with self._lock:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM cache")
+            self.connection.commit()
+
+
+class TieredCache:
+    """in-memory cache in front of an optional disk cache. Entries found on disk
+    are copied to memory so later lookups don't touch the disk."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get_many(self, keys):
+        keys = list(keys)
+        results = self.memory.get_many(keys)
+
+        missing = [key for key in keys if key not in results]
+        if self.disk is not None and missing:
+            disk_results = self.disk.get_entries(missing)
+            for key, (value, created) in disk_results.items():
+                # keep the original created time so the ttl is the same as disk
+                self.memory.set_many({key: value}, created)
+                results[key] = value
+
+        return results
+
+    def set_many(self, data):
+        self.memory.set_many(data)
+        if self.disk is not None:
+            self.disk.set_many(data)
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def create_cache(name, maxsize=10000, disk_maxsize=None, ttl=None, persist=True):
+    """create an in-memory cache that is backed by cache/<name>.sqlite3 when
+    persist is True"""
+    disk = None
+    if persist:
+        disk = DiskCache(cache_dir / f"{name}.sqlite3", maxsize=disk_maxsize, ttl=ttl)
+    return TieredCache(MemoryCache(maxsize, ttl), disk)
@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+import contextvars
+import threading
+
+from pywikibot.exceptions import FatalServerError
+
+import scripts.utils.metrics as metrics
+from scripts.utils.logger import logger
+
+# what to do when an operation makes more requests than its budget.
+# "raise" stops the operation with CallBudgetExceeded before the request is
+# sent, "warn" logs a warning once and lets the operation continue.
+ON_EXCEED_OPTIONS = ["raise", "warn"]
+
+current_ledger = contextvars.ContextVar("current_ledger", default=None)
+
+
+# pywikibot retries api requests that fail with most exceptions, but it lets
+# FatalServerError through, so the budget error stops the operation right away
+class CallBudgetExceeded(FatalServerError):
+    """raised when an operation makes more requests than its budget"""
+
+    def __init__(self, ledger, endpoint):
+        self.ledger = ledger
+        self.endpoint = endpoint
+        super().__init__(
+            f"{ledger.name}: request budget of {ledger.budget} exceeded "
+            f"({endpoint} from {metrics.get_phase()})"
+        )
+
+
+class CallLedger:
+    """count the requests made by an operation by endpoint and by function.
+    The function is the innermost metrics span when the request is sent."""
+
+    def __init__(self, name, budget=None, on_exceed="raise", parent=None):
+        if on_exceed not in ON_EXCEED_OPTIONS:
+            raise ValueError(f"on_exceed must be one of {ON_EXCEED_OPTIONS}")
+
+        self.name = name
+        self.budget = budget
+        self.on_exceed = on_exceed
+        self.parent = parent
+        self.total = 0
+        self.edits = 0
+        self.exceeded = False
+        # {(endpoint, function): count}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def check(self, endpoint):
+        """raise CallBudgetExceeded or log a warning if one more request would
+        be over the budget of this ledger or a parent ledger"""
+        if self.budget is not None and self.total >= self.budget:
+            if self.on_exceed == "raise":
+                self.exceeded = True
+                raise CallBudgetExceeded(self, endpoint)
+            if not self.exceeded:
+                self.exceeded = True
+                logger.warning(f"{self.name}: request budget of {self.budget} exceeded")
+
+        if self.parent:
+            self.parent.check(endpoint)
+
+    def record(self, endpoint, function, is_edit=False):
+        """count a request in this ledger and the parent ledgers"""
+        with self._lock:
+            self.total += 1
+            if is_edit:
+                self.edits += 1
+            key = (endpoint, function)
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+        if self.parent:
+            self.parent.record(endpoint, function, is_edit)
+
+    def totals(self):
+        """get the request counts as a dictionary that can be added to a
+        result"""
+        with self._lock:
+            by_endpoint = {}
+            by_function = {}
+            for (endpoint, function), count in self.counts.items():
+                by_endpoint[endpoint] = by_endpoint.get(endpoint, 0) + count
+                by_function[function] = by_function.get(function, 0) + count
+
+            return {
+                "total": self.total,
+                "edits": self.edits,
+                "budget": self.budget,
+                "exceeded": self.exceeded,
+                "by_endpoint": by_endpoint,
+                "by_function": by_function,
+            }
+
+
+@contextmanager
+def call_ledger(name, budget=None, on_exceed="raise"):
+    """count the requests made in a block of code. Requests are also counted in
+    the ledger of the enclosing block, so nested budgets are all enforced."""
+    ledger = CallLedger(name, budget, on_exceed, parent=current_ledger.get())
+    token = current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        current_ledger.reset(token)
+
+
+def get_ledger():
+    return current_ledger.get()
+
+
+def record_call(endpoint, is_edit=False):
+    """check the budget and count a request that is about to be sent.
+    is_edit is True for requests that edit a wiki."""
+    ledger = current_ledger.get()
+    if ledger is None:
+        return
+
+    ledger.check(endpoint)
+    ledger.record(endpoint, metrics.get_phase(), is_edit)
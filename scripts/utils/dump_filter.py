@@ -0,0 +1,137 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from pathlib import Path
+import time
+
+from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
+import scripts.utils.wikidata_dump as wikidata_dump
+
+# size in characters of the blocks of lines that are sent to a process
+BLOCK_SIZE = 8 * 1024 * 1024
+# number of blocks per process that are queued while the dump is read
+BLOCKS_PER_PROCESS = 2
+
+# filters of the current worker process, set once by init_worker so they are
+# not sent with every block
+worker_filters = {}
+
+
+def read_blocks(path, block_size=BLOCK_SIZE):
+    """generator of lists of dump lines with about block_size characters. The
+    blocks always end at the end of a line, so every entity is in one block."""
+    block = []
+    size = 0
+    with wikidata_dump.open_dump(path) as f:
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= block_size:
+                yield block
+                block = []
+                size = 0
+    if block:
+        yield block
+
+
+def init_worker(qids, properties, classes):
+    worker_filters.update({"qids": qids, "properties": properties, "classes": classes})
+
+
+def filter_block(block):
+    """parse and filter the lines in a block in a worker process. Returns the
+    number of entities that were checked and the compact json of the entities
+    that match the filters."""
+    checked = 0
+    selected = []
+    for line in block:
+        line = line.strip().rstrip(",")
+        if line in ["", "[", "]"]:
+            continue
+        checked += 1
+        if not wikidata_dump.line_may_match(line, **worker_filters):
+            continue
+
+        try:
+            entity = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if wikidata_dump.entity_matches(entity, **worker_filters):
+            selected.append((entity["id"], line))
+    return checked, selected
+
+
+@metrics.timed
+def filter_dump(
+    dump_path,
+    output_path,
+    qids=None,
+    properties=None,
+    classes=None,
+    processes=None,
+    block_size=BLOCK_SIZE,
+):
+    """write the entities in a dump that match the filters to a subset dump at
+    output_path, e.g. items.json.gz. The subset has the same format as the
+    wikidata dumps, so it can be read with read_dump and imported with
+    bulk_import_from_dump.
+
+    The dump is read in the main process and split into blocks of lines. The
+    blocks are parsed and filtered by a pool of processes, since parsing the
+    json is the slow part. Only BLOCKS_PER_PROCESS blocks per process are
+    queued, so memory does not grow with the size of the dump. The entities
+    are written in the same order as the dump. When every qid is found, the
+    rest of the dump is not read.
+
+    Returns the number of entities that were checked and selected."""
+    processes = processes or os.cpu_count() or 1
+    qids = set(qids) if qids is not None else None
+    remaining = set(qids) if qids is not None else None
+    start = time.time()
+    checked = 0
+    selected = 0
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    blocks = read_blocks(dump_path, block_size)
+    futures = deque()
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=init_worker,
+        initargs=(qids, properties, classes),
+    ) as executor, wikidata_dump.open_dump(output_path, "wt") as output:
+
+        def submit_next_block():
+            if remaining is not None and not remaining:
+                return
+            block = next(blocks, None)
+            if block:
+                futures.append(executor.submit(filter_block, block))
+
+        for _ in range(processes * BLOCKS_PER_PROCESS):
+            submit_next_block()
+
+        output.write("[\n")
+        while futures:
+            block_checked, block_selected = futures.popleft().result()
+            for id, line in block_selected:
+                output.write(",\n" if selected else "")
+                output.write(line)
+                selected += 1
+                if remaining is not None:
+                    remaining.discard(id)
+            checked += block_checked
+            submit_next_block()
+        output.write("\n]\n")
+
+    duration = max(time.time() - start, 1e-6)
+    logger.info(
+        f"Dump filtered: {selected} of {checked} entities selected, "
+        f"{round(checked / duration)} entities/s"
+    )
+    if remaining:
+        logger.warning(f"{len(remaining)} items not found in {dump_path}")
+    return {"checked": checked, "selected": selected}
@@ -0,0 +1,168 @@
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+if os.environ.get("BASE_DIR"):
+    data_dir = Path(os.environ.get("BASE_DIR"), "data")
+else:
+    data_dir = Path(Path(__file__).parent.parent.parent, "data")
+
+ID_MAPPING_PATH = data_dir / "id_mapping.sqlite3"
+
+# sqlite limits the number of variables in a query
+SQLITE_MAX_VARIABLES = 500
+
+mapping_store = None
+
+
+def get_repo_key(repo):
+    """local ids are only valid for one local wikibase, so mappings are stored
+    per repo, e.g. "mywikibase:en" """
+    return str(repo)
+
+
+class MappingStore:
+    """sqlite store of wikidata.org ids to the ids of the items that were
+    imported or matched in a local wikibase"""
+
+    def __init__(self, path=ID_MAPPING_PATH):
+        self.path = Path(path)
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        # create directory and database if they do not exists
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS id_mapping "
+                "(repo TEXT, wikidata_id TEXT, local_id TEXT, updated REAL, "
+                "PRIMARY KEY (repo, wikidata_id))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tracked_items "
+                "(repo TEXT, wikidata_id TEXT, lastrevid INTEGER, updated REAL, "
+                "PRIMARY KEY (repo, wikidata_id))"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def get_many(self, repo, wikidata_ids):
+        """get {wikidata id: local id} for the ids that are mapped"""
+        wikidata_ids = list(wikidata_ids)
+        repo_key = get_repo_key(repo)
+        results = {}
+        with self._lock:
+            for i in range(0, len(wikidata_ids), SQLITE_MAX_VARIABLES):
+                chunk_ids = wikidata_ids[i : i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk_ids))
+                query = (
+                    "SELECT wikidata_id, local_id FROM id_mapping "
+                    f"WHERE repo = ? AND wikidata_id IN ({placeholders})"
+                )
+                rows = self.connection.execute(query, [repo_key, *chunk_ids])
+                results.update(rows.fetchall())
+        return results
+
+    def set_many(self, repo, mappings):
+        """save {wikidata id: local id}"""
+        repo_key = get_repo_key(repo)
+        now = time.time()
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO id_mapping VALUES (?, ?, ?, ?)",
+                [
+                    (repo_key, wikidata_id, local_id, now)
+                    for wikidata_id, local_id in mappings.items()
+                ],
+            )
+            self.connection.commit()
+
+    def get(self, repo, wikidata_id):
+        return self.get_many(repo, [wikidata_id]).get(wikidata_id)
+
+    def set(self, repo, wikidata_id, local_id):
+        self.set_many(repo, {wikidata_id: local_id})
+
+    def delete(self, repo, wikidata_id):
+        """remove a mapping, e.g. when the local item was deleted"""
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM id_mapping WHERE repo = ? AND wikidata_id = ?",
+                (get_repo_key(repo), wikidata_id),
+            )
+            self.connection.commit()
+
+    def get_all(self, repo):
+        """get {wikidata id: local id} for every mapping in a repo"""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT wikidata_id, local_id FROM id_mapping WHERE repo = ?",
+                (get_repo_key(repo),),
+            )
+            return dict(rows.fetchall())
+
+    def track_many(self, repo, revisions):
+        """save {wikidata id: lastrevid} for items that were imported with their
+        statements. Only these items are synced; items that are only used in
+        claims, e.g. units and stubs, are mapped but not tracked."""
+        repo_key = get_repo_key(repo)
+        now = time.time()
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tracked_items VALUES (?, ?, ?, ?)",
+                [
+                    (repo_key, wikidata_id, lastrevid, now)
+                    for wikidata_id, lastrevid in revisions.items()
+                ],
+            )
+            self.connection.commit()
+
+    def untrack(self, repo, wikidata_id):
+        """stop syncing an item, e.g. when it was merged into another item"""
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM tracked_items WHERE repo = ? AND wikidata_id = ?",
+                (get_repo_key(repo), wikidata_id),
+            )
+            self.connection.commit()
+
+    def get_tracked(self, repo):
+        """get {wikidata id: lastrevid} for every tracked item in a repo. The
+        lastrevid is the wikidata.org revision that was imported, or None."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT wikidata_id, lastrevid FROM tracked_items WHERE repo = ?",
+                (get_repo_key(repo),),
+            )
+            return dict(rows.fetchall())
+
+
+def configure_mapping_store(path=ID_MAPPING_PATH):
+    """replace the mapping store used by the import functions"""
+    global mapping_store
+    mapping_store = MappingStore(path)
+    return mapping_store
+
+
+def get_mapping_store():
+    if mapping_store is None:
+        configure_mapping_store()
+    return mapping_store
+
+
+def get_local_id(repo, wikidata_id):
+    """get the local id for a wikidata.org id, or None if it is not mapped"""
+    return get_mapping_store().get(repo, wikidata_id)
+
+
+def set_local_id(repo, wikidata_id, local_id):
+    get_mapping_store().set(repo, wikidata_id, local_id)
+
+
+def track_item(repo, wikidata_id, lastrevid=None):
+    get_mapping_store().track_many(repo, {wikidata_id: lastrevid})
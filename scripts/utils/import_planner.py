@@ -0,0 +1,179 @@
+from collections import deque
+
+import scripts.utils.bulk_import as bulk_import
+import scripts.utils.id_mapping as id_mapping
+import scripts.utils.import_wikidata_records as iwr
+from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
+import scripts.utils.wikidata_utils as wd
+
+# items up to DEFAULT_DEPTH levels away from the root items are imported with
+# their statements. Items one level further are imported as stubs with only
+# labels, descriptions and aliases, the same as items that are imported by
+# convert_to_local_claim_value.
+DEFAULT_DEPTH = 0
+
+
+def get_item_dependencies(item):
+    """get the qids of the items used in the claims, qualifiers and references
+    of an item, e.g. item values and quantity units"""
+    qids = wd.get_ids_for_item(
+        item, item.toJSON(), include_pids=False, include_qids=True
+    )
+    return set(qids) - {item.id}
+
+
+@metrics.timed
+def plan_import(site, local_repo, root_qids, depth=DEFAULT_DEPTH):
+    """walk the claims of the root items and the items they use, up to depth
+    levels away from the root items. Items are loaded in batches of 50, and
+    items that are used by several items are only loaded once. Items that are
+    already in the id mapping store are not imported again.
+
+    Returns a dictionary with:
+    - items: {qid: ItemPage} for every item in the plan
+    - dependencies: {qid: set of qids} for the items that get statements
+    - stubs: qids of the items that are imported without statements
+    - order: qids of the items that get statements, in dependency order
+    - entity_cache: {qid: item_dict} for every item in the plan
+    """
+    store = id_mapping.get_mapping_store()
+    items = {}
+    dependencies = {}
+    stubs = []
+
+    frontier = list(dict.fromkeys(root_qids))
+    level = 0
+    seen = set(frontier)
+    while frontier:
+        loaded = wd.load_items(site, frontier)
+        items.update({item.id: item for item in loaded})
+
+        # items after the last level are stubs, so their claims are not walked
+        if level > depth:
+            stubs += [item.id for item in loaded]
+            break
+
+        next_frontier = set()
+        for item in loaded:
+            item_dependencies = get_item_dependencies(item)
+            dependencies[item.id] = item_dependencies
+            next_frontier.update(item_dependencies - seen)
+
+        mapped = store.get_many(local_repo, next_frontier)
+        frontier = [qid for qid in next_frontier if qid not in mapped]
+        seen.update(next_frontier)
+        level += 1
+
+    # drop dependencies that are already imported or could not be loaded
+    for qid, item_dependencies in dependencies.items():
+        dependencies[qid] = {dep for dep in item_dependencies if dep in items}
+
+    logger.info(
+        f"Import plan: {len(dependencies)} items with statements, "
+        f"{len(stubs)} stubs"
+    )
+    return {
+        "items": items,
+        "dependencies": dependencies,
+        "stubs": stubs,
+        "order": topological_order(dependencies),
+        "entity_cache": {qid: item.get() for qid, item in items.items()},
+    }
+
+
+def topological_order(dependencies):
+    """order {qid: set of qids} so that every qid comes after the qids it
+    depends on, using Kahn's algorithm. graphlib is not used since it needs
+    Python 3.9.
+
+    Claims can form cycles, e.g. two items that are each other's part of. A
+    cycle is broken by adding the qid with the fewest dependencies left and the
+    most dependents. When that item is imported, convert_to_local_claim_value
+    creates the missing dependency without statements, as it does for any
+    item that is not mapped yet, and maps it. The statements of the dependency
+    are added to that local item when it is reached later in the order."""
+    position = {qid: index for index, qid in enumerate(dependencies)}
+    remaining = {
+        qid: {dep for dep in deps if dep in dependencies and dep != qid}
+        for qid, deps in dependencies.items()
+    }
+    dependents = {qid: [] for qid in dependencies}
+    for qid, deps in remaining.items():
+        for dep in deps:
+            dependents[dep].append(qid)
+
+    ready = deque(qid for qid in dependencies if not remaining[qid])
+    queued = set(ready)
+    order = []
+    while len(order) < len(dependencies):
+        if not ready:
+            qid = min(
+                (qid for qid in dependencies if qid not in queued),
+                key=lambda qid: (
+                    len(remaining[qid]),
+                    -len(dependents[qid]),
+                    position[qid],
+                ),
+            )
+            logger.info(f"Dependency cycle broken at {qid}")
+            ready.append(qid)
+            queued.add(qid)
+
+        qid = ready.popleft()
+        order.append(qid)
+        for dependent in dependents[qid]:
+            remaining[dependent].discard(qid)
+            if not remaining[dependent] and dependent not in queued:
+                ready.append(dependent)
+                queued.add(dependent)
+
+    return order
+
+
+@metrics.timed
+def create_stub_items(plan, local_site, limit_languages=False):
+    """import the stub items in a plan with only labels, descriptions and
+    aliases. Stubs that already exist locally are matched instead."""
+    local_repo = local_site.data_repository()
+    for qid in plan["stubs"]:
+        item_dict = plan["items"][qid].get()
+        try:
+            iwr.find_or_create_local_item(
+                item_dict, local_site, local_repo, limit_languages, qid
+            )
+        except Exception as err:
+            logger.error(f"Could not create stub {qid}: {err}")
+
+
+@metrics.timed
+def import_with_dependencies(
+    root_qids,
+    site,
+    local_site,
+    local_site_url,
+    depth=DEFAULT_DEPTH,
+    journal_path=bulk_import.JOURNAL_PATH,
+    limit_languages=False,
+    **import_kwargs,
+):
+    """import the root items and the items they use. The stubs are created
+    first, then the other items are imported in dependency order, so every
+    item is imported once and the claims of later items use the local ids in
+    the id mapping store. The items loaded by the plan are passed to
+    bulk_import, so they are not loaded again. import_kwargs are passed to
+    bulk_import."""
+    plan = plan_import(site, local_site.data_repository(), root_qids, depth)
+    create_stub_items(plan, local_site, limit_languages)
+
+    return bulk_import.bulk_import(
+        plan["order"],
+        site,
+        local_site,
+        local_site_url,
+        journal_path=journal_path,
+        items=plan["items"],
+        entity_cache=plan["entity_cache"],
+        limit_languages=limit_languages,
+        **import_kwargs,
+    )
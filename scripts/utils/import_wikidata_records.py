@@ -1,12 +1,36 @@
 import pywikibot
 
+import scripts.utils.call_ledger as call_ledger
+import scripts.utils.id_mapping as id_mapping
+import scripts.utils.item_diff as item_diff
 import scripts.utils.wikidata_utils as wd
 from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
 import scripts.utils.wiki_queries as wq
 import scripts.utils.wiki_serialization as ws
 
+# per_edit: add each statement, qualifier and reference group in its own edit
+# statement: add each statement with its qualifiers and references in one edit
+# entity: save labels, descriptions, aliases and all statements in one edit
+# diff: save only the differences between the wikidata.org item and the local
+# item in one edit
+WRITE_MODES = ["per_edit", "statement", "entity", "diff"]
+
+# NOTE:skip P4656 "Wikimedia import URL" since we don't have wikipedia pages.
+# https://phabricator.wikimedia.org/T301243
+# NOTE: skip P854 reference url since there is a bug with saving URL
+SKIPPED_SOURCE_PROPERTIES = ["P4656", "P854"]
+
+
+def find_local_item(item_dict, local_site, local_repo, qid=None):
+    """get the local item for a wikidata.org item, or None if the item does not
+    exist locally. When qid is given, the id mapping store is checked before
+    searching, and the local id is saved in the store."""
+    if qid:
+        local_id = id_mapping.get_local_id(local_repo, qid)
+        if local_id:
+            return pywikibot.ItemPage(local_repo, local_id)
 
-def find_or_create_local_item(item_dict, local_site, local_repo, limit_languages=False):
     lang = ws.get_claim_language(item_dict)
     label = item_dict["labels"][lang]
     description = item_dict["descriptions"][lang]
@@ -30,36 +54,99 @@ def find_or_create_local_item(item_dict, local_site, local_repo, limit_languages
                 existing = True
                 existing_id = result["id"]
 
+    if not existing:
+        return
+
+    if qid:
+        id_mapping.set_local_id(local_repo, qid, existing_id)
+    return pywikibot.ItemPage(local_repo, existing_id)
+
+
+@metrics.timed
+def find_or_create_local_item(
+    item_dict, local_site, local_repo, limit_languages=False, qid=None
+):
+    """get the local item for a wikidata.org item, or import the item if it
+    does not exist locally. When qid is given, the id mapping store is checked
+    before searching, and the local id is saved in the store."""
     # get existing item
-    if existing:
-        item = pywikibot.ItemPage(local_repo, existing_id)
+    item = find_local_item(item_dict, local_site, local_repo, qid)
+    if item:
+        return item
+
     # create new item
-    else:
-        item = wd.import_item(
-            local_site,
-            item_dict,
-            import_sitelinks=False,
-            limit_languages=limit_languages,
-        )
+    item = wd.import_item(
+        local_site,
+        item_dict,
+        import_sitelinks=False,
+        limit_languages=limit_languages,
+    )
+
+    if qid and item:
+        id_mapping.set_local_id(local_repo, qid, item.id)
 
     return item
 
 
-def add_statements_to_local_item(item_dict, repo, local_item, local_site, local_repo):
+@metrics.timed
+def add_statements_to_local_item(
+    item_dict, repo, local_item, local_site, local_repo, entity_cache=None
+):
     # iterate over all the wikidata.org claims
     for property, values in item_dict["claims"].items():
         for claim in values:
 
             new_claim_value = wd.convert_to_local_claim_value(
-                local_site, local_repo, claim, import_sitelinks=False
+                local_site,
+                local_repo,
+                claim,
+                import_sitelinks=False,
+                entity_cache=entity_cache,
             )
             if new_claim_value:
                 wd.add_claim(repo, local_item, property, new_claim_value)
 
 
+def index_claims(claim_groups):
+    """create {(property, normalized value): claim} for a list of
+    {property: [claims]} dictionaries, e.g. [item.claims], [claim.qualifiers]
+    or claim.sources, so a claim with a value is found without a scan"""
+    index = {}
+    for claims_dict in claim_groups:
+        for property, claims in claims_dict.items():
+            for claim in claims:
+                key = (property, ws.normalize_claim_value(claim.getTarget()))
+                index[key] = claim
+    return index
+
+
+def index_claims_by_label(claims_dict, id_label_dict):
+    """create {(property, label): claim} for {property: [claims]}. Local
+    claims and wikidata.org claims use different ids, so they are matched by
+    the label that get_claim_label shows for the value."""
+    index = {}
+    for property, claims in claims_dict.items():
+        for claim in claims:
+            try:
+                label = ws.get_claim_label(claim, id_label_dict, False)
+            except KeyError:
+                continue
+            index[(property, ws.freeze_value(label))] = claim
+    return index
+
+
 def add_qualifier_to_wikidata_claim(
-    claim, local_claim, local_site, local_repo, site, repo, import_sitelinks
+    claim,
+    local_claim,
+    local_site,
+    local_repo,
+    site,
+    repo,
+    import_sitelinks,
+    entity_cache=None,
 ):
+    local_qualifiers = index_claims([local_claim.qualifiers])
+
     # claim.qualifiers returns an ordered dictionary
     for qualifier_property, qualifier_claims in claim.qualifiers.items():
 
@@ -69,47 +156,51 @@ def add_qualifier_to_wikidata_claim(
                 local_repo,
                 qualifier_claim,
                 import_sitelinks,
+                entity_cache,
             )
 
-            # check is source exists locally
-            exists = False
-            if qualifier_property in local_claim.qualifiers:
-                for l_source in local_claim.qualifiers[qualifier_property]:
-                    if l_source.getTarget() == qualifier_value:
-                        exists = True
+            # check is qualifier exists locally
+            key = (qualifier_property, ws.normalize_claim_value(qualifier_value))
+            if key in local_qualifiers:
+                continue
 
-            # add new source claim
-            if not exists:
-                try:
-                    new_claim = pywikibot.Claim(repo, qualifier_property)
-                    new_claim.setTarget(qualifier_value)
-                    local_claim.addQualifier(new_claim, summary="Add qualifier.")
-                    logger.info(
-                        f"Add qualifier: {claim.id} "
-                        f"{qualifier_property} {qualifier_value}"
-                    )
-                except:
-                    logger.error(
-                        f"Qualifier not added: {claim.id} "
-                        f"{qualifier_property} {qualifier_value}"
-                    )
+            # add new qualifier claim
+            try:
+                new_claim = pywikibot.Claim(repo, qualifier_property)
+                new_claim.setTarget(qualifier_value)
+                local_claim.addQualifier(new_claim, summary="Add qualifier.")
+                local_qualifiers[key] = new_claim
+                logger.info(
+                    f"Add qualifier: {claim.id} "
+                    f"{qualifier_property} {qualifier_value}"
+                )
+            except call_ledger.CallBudgetExceeded:
+                raise
+            except:
+                logger.error(
+                    f"Qualifier not added: {claim.id} "
+                    f"{qualifier_property} {qualifier_value}"
+                )
 
 
 def add_source_to_wikidata_claim(
-    claim, local_claim, local_site, local_repo, site, repo, import_sitelinks
+    claim,
+    local_claim,
+    local_site,
+    local_repo,
+    site,
+    repo,
+    import_sitelinks,
+    entity_cache=None,
 ):
+    local_sources = index_claims(local_claim.sources)
+
     # claim.sources returns a list or ordered dictionariers
     for claim_source in claim.sources:
         new_sources = []
         for source_property, source_values in claim_source.items():
 
-            # NOTE:skip P4656 "Wikimedia import URL"
-            # since we don't have wikipedia pages.
-            # https://phabricator.wikimedia.org/T301243
-            if source_property in ["P4656"]:
-                continue
-            # NOTE: skip reference url since there is a bug with saving URL
-            if source_property in ["P854"]:
+            if source_property in SKIPPED_SOURCE_PROPERTIES:
                 continue
 
             for source_claim in source_values:
@@ -118,51 +209,56 @@ def add_source_to_wikidata_claim(
                     local_repo,
                     source_claim,
                     import_sitelinks,
+                    entity_cache,
                 )
 
                 # check is source exists locally
-                exists = False
-                for l_source in local_claim.sources:
-                    if source_property in l_source.keys():
-                        for ll_source in l_source[source_property]:
-                            if ll_source.getTarget() == source_value:
-                                exists = True
+                key = (source_property, ws.normalize_claim_value(source_value))
+                if key in local_sources:
+                    continue
 
                 # add new source claim
-                if not exists:
-                    try:
-                        new_source = pywikibot.Claim(repo, source_property)
-                        new_source.setTarget(source_value)
-                    except:
-                        print("new_source target", source_property)
-                    new_sources.append(new_source)
+                try:
+                    new_source = pywikibot.Claim(repo, source_property)
+                    new_source.setTarget(source_value)
+                except:
+                    logger.error(f"Source not added: {claim.id} {source_property}")
+                    continue
+                new_sources.append(new_source)
+                local_sources[key] = new_source
 
         if len(new_sources) > 0:
             try:
                 local_claim.addSources(new_sources, summary="Adding sources.")
                 logger.info(f"Sources added: {local_claim.id}")
+            except call_ledger.CallBudgetExceeded:
+                raise
             except:
                 logger.error(f"Sources not saved: {local_claim.id}")
 
 
+@metrics.timed
 def create_local_id_label_dictionary(local_item, wikibase_url):
     # can't use sparql to get labels for local wikibase qid because I can't
     # get sparql working. use api call to local wikibase to get labels.
     # api call doesn't work on federated properties.
+    # the label cache is not used, since a stale label would not match the
+    # claims of the wikidata.org item.
     qids = wd.get_ids_for_item(
         local_item, local_item.toJSON(), include_pids=False, include_qids=True
     )
-    qid_dict = wq.fetch_and_format_labels_for_ids(qids, wikibase_url)
+    qid_dict = wq.fetch_and_format_labels_for_ids(qids, wikibase_url, use_cache=False)
 
     # use sparql query to wikidata.org to get pids
     pids = wd.get_ids_for_item(
         local_item, local_item.toJSON(), include_pids=True, include_qids=False
     )
-    pid_dict = wq.fetch_and_format_labels_for_ids_sqarql(pids)
+    pid_dict = wq.fetch_and_format_labels_for_ids_sqarql(pids, use_cache=False)
 
     return {**qid_dict, **pid_dict}
 
 
+@metrics.timed
 def add_sources_and_qualifiers_to_local_item(
     item_dict,
     id_label_dict,
@@ -172,7 +268,10 @@ def add_sources_and_qualifiers_to_local_item(
     local_id_label_dict,
     local_site,
     local_repo,
+    entity_cache=None,
 ):
+    local_claims = index_claims_by_label(local_item.claims, local_id_label_dict)
+
     # iterate over all the wikidata.org claims
     for property, claims in item_dict["claims"].items():
         for claim in claims:
@@ -181,12 +280,11 @@ def add_sources_and_qualifiers_to_local_item(
                 continue
 
             # get the corresponding local claim
-            if claim.id in local_item.claims:
-                for l_claim in local_item.claims[claim.id]:
-                    if ws.get_claim_label(
-                        l_claim, local_id_label_dict, False
-                    ) == ws.get_claim_label(claim, id_label_dict, False):
-                        local_claim = l_claim
+            label = ws.get_claim_label(claim, id_label_dict, False)
+            local_claim = local_claims.get((claim.id, ws.freeze_value(label)))
+            if local_claim is None:
+                logger.error(f"{claim.id} local claim not found")
+                continue
 
             try:
                 add_source_to_wikidata_claim(
@@ -197,7 +295,10 @@ def add_sources_and_qualifiers_to_local_item(
                     site,
                     repo,
                     import_sitelinks=False,
+                    entity_cache=entity_cache,
                 )
+            except call_ledger.CallBudgetExceeded:
+                raise
             except:
                 logger.error(f"{claim.id} source not added")
 
@@ -210,53 +311,507 @@ def add_sources_and_qualifiers_to_local_item(
                     site,
                     repo,
                     import_sitelinks=False,
+                    entity_cache=entity_cache,
                 )
+            except call_ledger.CallBudgetExceeded:
+                raise
             except:
                 logger.error(f"{claim.id} qualifier not added")
 
 
-def import_wikidata_item_to_local_wikibase(
-    qid, site, local_site, local_site_url, add_statements=True, add_sources=True, limit_languages=False
+def create_local_snak(
+    snak_claim, property, local_site, local_repo, repo, entity_cache=None, **kwargs
 ):
-    pywikibot.config.put_throttle = 2
-    local_repo = local_site.data_repository()
+    """create an unsaved claim, qualifier or reference for the local item from a
+    wikidata.org claim. kwargs are passed to pywikibot.Claim, e.g.
+    is_qualifier=True. Returns None if the value can't be imported."""
+    value = wd.convert_to_local_claim_value(
+        local_site, local_repo, snak_claim, False, entity_cache
+    )
+    if not value:
+        return
+
+    new_snak = pywikibot.Claim(repo, property, **kwargs)
+    try:
+        new_snak.setTarget(value)
+    except Exception:
+        logger.error(f"Could not set target: {property} {value}")
+        return
+    return new_snak
 
-    repo = site.data_repository()
-    item = pywikibot.ItemPage(repo, qid)
-    item_dict = item.get()
 
-    local_item = find_or_create_local_item(
-        item_dict, local_site, local_repo, limit_languages
+def build_local_claim(
+    claim,
+    property,
+    local_site,
+    local_repo,
+    repo,
+    add_sources=True,
+    entity_cache=None,
+):
+    """create an unsaved claim for the local item with the qualifiers and
+    references of a wikidata.org claim attached. Qualifiers and references are
+    only added to the claim object, so saving the claim is one edit."""
+    new_claim = create_local_snak(
+        claim, property, local_site, local_repo, repo, entity_cache
     )
+    if new_claim:
+        new_claim.setRank(claim.rank)
+    if not new_claim or not add_sources:
+        return new_claim
 
-    if add_statements:
-        print("add statements begin...")
-        add_statements_to_local_item(
-            item_dict, repo, local_item, local_site, local_repo
-        )
-        id_label_dict = wd.create_id_label_dictionary(item, item.toJSON())
-        local_id_label_dict = create_local_id_label_dictionary(local_item, local_site_url)
-        print("add statements end...")
-
-    if add_sources:
-        # reload item after adding statements, then add sources/qualifiers
-        local_item = find_or_create_local_item(
-            item_dict, local_site, local_repo, limit_languages
-        )
+    for qualifier_property, qualifier_claims in claim.qualifiers.items():
+        for qualifier_claim in qualifier_claims:
+            qualifier = create_local_snak(
+                qualifier_claim,
+                qualifier_property,
+                local_site,
+                local_repo,
+                repo,
+                entity_cache,
+                is_qualifier=True,
+            )
+            if qualifier:
+                new_claim.addQualifier(qualifier)
+
+    for claim_source in claim.sources:
+        sources = []
+        for source_property, source_claims in claim_source.items():
+            if source_property in SKIPPED_SOURCE_PROPERTIES:
+                continue
+
+            for source_claim in source_claims:
+                source = create_local_snak(
+                    source_claim,
+                    source_property,
+                    local_site,
+                    local_repo,
+                    repo,
+                    entity_cache,
+                    is_reference=True,
+                )
+                if source:
+                    sources.append(source)
+
+        if sources:
+            new_claim.addSources(sources)
+
+    return new_claim
+
+
+@metrics.timed
+def add_full_statements_to_local_item(
+    item_dict,
+    site,
+    repo,
+    local_item,
+    local_site,
+    local_repo,
+    add_sources=True,
+    entity_cache=None,
+):
+    """add each wikidata.org claim to the local item with its qualifiers and
+    references in one wbsetclaim edit. When the local item already has a claim
+    with the same value, the missing qualifiers and references are added to
+    that claim instead."""
+    local_claims = index_claims([local_item.claims])
+
+    for property, claims in item_dict["claims"].items():
+        for claim in claims:
+            new_claim = build_local_claim(
+                claim,
+                property,
+                local_site,
+                local_repo,
+                repo,
+                add_sources,
+                entity_cache,
+            )
+            if not new_claim:
+                continue
+
+            key = (property, ws.normalize_claim_value(new_claim.target))
+            local_claim = local_claims.get(key)
+
+            if local_claim is None:
+                try:
+                    # addClaim creates the claim GUID and saves the claim json,
+                    # including qualifiers and references, with wbsetclaim
+                    local_item.addClaim(new_claim, summary="Add claim.")
+                    local_claims[key] = new_claim
+                    logger.info(
+                        f"Add claim: {local_item.id} {property} {new_claim.target}"
+                    )
+                except call_ledger.CallBudgetExceeded:
+                    raise
+                except Exception:
+                    logger.error(
+                        f"Could not add claim: {local_item.id} {property} "
+                        f"{new_claim.target}"
+                    )
+                continue
+
+            if not add_sources:
+                continue
+
+            for add_to_claim in [
+                add_source_to_wikidata_claim,
+                add_qualifier_to_wikidata_claim,
+            ]:
+                try:
+                    add_to_claim(
+                        claim,
+                        local_claim,
+                        local_site,
+                        local_repo,
+                        site,
+                        repo,
+                        import_sitelinks=False,
+                        entity_cache=entity_cache,
+                    )
+                except call_ledger.CallBudgetExceeded:
+                    raise
+                except Exception:
+                    logger.error(f"{claim.id} sources or qualifiers not added")
+
+
+def build_local_entity_data(
+    item_dict,
+    local_site,
+    local_repo,
+    repo,
+    local_item=None,
+    limit_languages=False,
+    add_statements=True,
+    add_sources=True,
+    entity_cache=None,
+):
+    """create the wbeditentity data for the local item: labels, descriptions,
+    aliases and claims with their qualifiers and references. Items used in the
+    claims are found or imported first, so the claims use local ids. Claims
+    that already exist on local_item are left out."""
+    data = wd.format_import_data(
+        item_dict, import_sitelinks=False, limit_languages=limit_languages
+    )
+    if not add_statements:
+        return data
+
+    local_claims = {}
+    if local_item is not None:
+        local_claims = index_claims([local_item.claims])
+
+    claims = []
+    for property, item_claims in item_dict["claims"].items():
+        for claim in item_claims:
+            new_claim = build_local_claim(
+                claim,
+                property,
+                local_site,
+                local_repo,
+                repo,
+                add_sources,
+                entity_cache,
+            )
+            if not new_claim:
+                continue
+
+            key = (property, ws.normalize_claim_value(new_claim.target))
+            if key not in local_claims:
+                claims.append(new_claim.toJSON())
+                local_claims[key] = new_claim
+
+    if claims:
+        data["claims"] = claims
+    return data
+
+
+def count_claim_snaks(claim):
+    """count the main snak, qualifiers and imported references of a
+    wikidata.org claim"""
+    qualifiers = sum(len(snaks) for snaks in claim.qualifiers.values())
+    references = sum(
+        len(snaks)
+        for source in claim.sources
+        for property, snaks in source.items()
+        if property not in SKIPPED_SOURCE_PROPERTIES
+    )
+    return 1 + qualifiers + references
+
+
+def count_statement_snaks(statement):
+    """count the main snak, qualifiers and references of a statement json"""
+    qualifiers = sum(len(snaks) for snaks in statement.get("qualifiers", {}).values())
+    references = sum(
+        len(snaks)
+        for reference in statement.get("references", [])
+        for snaks in reference["snaks"].values()
+    )
+    return 1 + qualifiers + references
+
+
+def get_incomplete_properties(item_dict, data):
+    """get the properties of a wikidata.org item with claims, qualifiers or
+    references that are not in the wbeditentity data from
+    build_local_entity_data, e.g. values that could not be converted"""
+    counts = {}
+    for statement in data.get("claims", []):
+        property = statement["mainsnak"]["property"]
+        counts[property] = counts.get(property, 0) + count_statement_snaks(statement)
+
+    return {
+        property
+        for property, claims in item_dict["claims"].items()
+        if counts.get(property, 0) < sum(count_claim_snaks(claim) for claim in claims)
+    }
+
+
+@metrics.timed
+def save_local_entity(
+    qid,
+    item_dict,
+    local_site,
+    local_repo,
+    repo,
+    limit_languages=False,
+    add_statements=True,
+    add_sources=True,
+    entity_cache=None,
+):
+    """import a wikidata.org item with one wbeditentity edit. New items are
+    created with all their statements; existing local items get the missing
+    statements. ValueError is raised when the edit is not saved, e.g. when the
+    label and description of a new item conflict with another local item."""
+    local_item = find_local_item(item_dict, local_site, local_repo, qid)
+    data = build_local_entity_data(
+        item_dict,
+        local_site,
+        local_repo,
+        repo,
+        local_item,
+        limit_languages,
+        add_statements,
+        add_sources,
+        entity_cache,
+    )
+
+    created = local_item is None
+    if created:
+        local_item = pywikibot.ItemPage(local_repo)
+
+    # edit_entity logs failed edits and returns None, or the other item when
+    # there is a label and description conflict
+    saved = wd.edit_entity(local_item, data)
+    if saved is not None and saved is not local_item:
+        raise ValueError(f"{qid} could not be saved: conflicts with {saved.id}")
+    if saved is None or local_item.id == "-1":
+        raise ValueError(f"{qid} could not be saved")
+    if created:
+        id_mapping.set_local_id(local_repo, qid, local_item.id)
+
+    logger.info(f"Item saved: {qid} {local_item.id} {len(data.get('claims', []))}")
+    return local_item
 
-        print("add souces / qualifiers begin...")
-        add_sources_and_qualifiers_to_local_item(
+
+@metrics.timed
+def sync_local_entity(
+    qid,
+    item_dict,
+    local_site,
+    local_repo,
+    repo,
+    limit_languages=False,
+    add_statements=True,
+    add_sources=True,
+    entity_cache=None,
+    allow_removals=False,
+):
+    """update a local item so it matches a wikidata.org item with one
+    wbeditentity edit that only has the changed terms and statements. Nothing
+    is saved if the items are the same. With allow_removals, terms and
+    statements that are not on the wikidata.org item are removed, except for
+    properties with values that could not be converted. New items are created
+    the same as save_local_entity."""
+    local_item = find_local_item(item_dict, local_site, local_repo, qid)
+    if local_item is None:
+        return save_local_entity(
+            qid,
             item_dict,
-            id_label_dict,
-            site,
-            repo,
-            local_item,
-            local_id_label_dict,
             local_site,
             local_repo,
+            repo,
+            limit_languages,
+            add_statements,
+            add_sources,
+            entity_cache,
         )
-        print("add souces / qualifiers end...")
 
-    lang = wd.get_claim_language(item_dict)
-    label = item_dict["labels"][lang]
-    return {"id": local_item.id, "label": label, "item": local_item}
+    desired = build_local_entity_data(
+        item_dict,
+        local_site,
+        local_repo,
+        repo,
+        None,
+        limit_languages,
+        add_statements,
+        add_sources,
+        entity_cache,
+    )
+    incomplete = get_incomplete_properties(item_dict, desired) if add_statements else ()
+    if allow_removals and incomplete:
+        logger.warning(f"{qid}: statements not removed for {sorted(incomplete)}")
+
+    local_item.get(force=True)
+    changes = item_diff.diff_entity(
+        desired, local_item.toJSON(), allow_removals, incomplete
+    )
+    if not add_statements:
+        changes.pop("claims", None)
+
+    if changes:
+        local_item.editEntity(changes, summary="Update item from wikidata.")
+    counts = item_diff.count_changes(changes)
+    logger.info(f"Item synced: {qid} {local_item.id} {counts}")
+    return local_item
+
+
+@metrics.timed
+def import_wikidata_item_to_local_wikibase(
+    qid,
+    site,
+    local_site,
+    local_site_url,
+    add_statements=True,
+    add_sources=True,
+    limit_languages=False,
+    budget=None,
+    on_budget_exceeded="raise",
+    write_mode="per_edit",
+    item=None,
+    entity_cache=None,
+    allow_removals=False,
+):
+    """budget is the maximum number of requests for the import. When it is
+    exceeded, CallBudgetExceeded is raised, or a warning is logged when
+    on_budget_exceeded is "warn". The request counts are returned as
+    "api_calls".
+
+    write_mode is one of WRITE_MODES. "per_edit" adds each statement, qualifier
+    and reference group in its own edit. "statement" adds each statement with
+    its qualifiers and references in one edit. "entity" saves the whole item in
+    one edit. "diff" saves only the changes since the item was imported in one
+    edit; allow_removals also removes terms and statements that are not on the
+    wikidata.org item.
+
+    item is an optional wikidata.org ItemPage that was already loaded, and
+    entity_cache is an optional {qid: item_dict} of the items used in its
+    claims, e.g. from a bulk import that loads items in batches."""
+    if write_mode not in WRITE_MODES:
+        raise ValueError(f"write_mode must be one of {WRITE_MODES}")
+
+    pywikibot.config.put_throttle = 2
+    with call_ledger.call_ledger(qid, budget, on_budget_exceeded) as ledger:
+        local_repo = local_site.data_repository()
+
+        repo = site.data_repository()
+        if item is None:
+            item = pywikibot.ItemPage(repo, qid)
+        item_dict = item.get()
+
+        # load the items used in the claims in batches before converting claims
+        if entity_cache is None and (add_statements or add_sources):
+            entity_cache = wd.prefetch_entities(site, local_repo, [item])
+
+        if write_mode == "entity":
+            local_item = save_local_entity(
+                qid,
+                item_dict,
+                local_site,
+                local_repo,
+                repo,
+                limit_languages,
+                add_statements,
+                add_sources,
+                entity_cache,
+            )
+        elif write_mode == "diff":
+            local_item = sync_local_entity(
+                qid,
+                item_dict,
+                local_site,
+                local_repo,
+                repo,
+                limit_languages,
+                add_statements,
+                add_sources,
+                entity_cache,
+                allow_removals,
+            )
+        else:
+            local_item = find_or_create_local_item(
+                item_dict, local_site, local_repo, limit_languages, qid
+            )
+
+        if write_mode == "statement":
+            if add_statements:
+                add_full_statements_to_local_item(
+                    item_dict,
+                    site,
+                    repo,
+                    local_item,
+                    local_site,
+                    local_repo,
+                    add_sources,
+                    entity_cache,
+                )
+
+        elif write_mode == "per_edit" and add_statements:
+            print("add statements begin...")
+            add_statements_to_local_item(
+                item_dict, repo, local_item, local_site, local_repo, entity_cache
+            )
+            id_label_dict = wd.create_id_label_dictionary(
+                item, item.toJSON(), use_cache=False
+            )
+            local_id_label_dict = create_local_id_label_dictionary(
+                local_item, local_site_url
+            )
+            print("add statements end...")
+
+        if add_sources and write_mode == "per_edit":
+            # reload item after adding statements, then add sources/qualifiers
+            local_item = find_or_create_local_item(
+                item_dict, local_site, local_repo, limit_languages, qid
+            )
+
+            print("add souces / qualifiers begin...")
+            add_sources_and_qualifiers_to_local_item(
+                item_dict,
+                id_label_dict,
+                site,
+                repo,
+                local_item,
+                local_id_label_dict,
+                local_site,
+                local_repo,
+                entity_cache,
+            )
+            print("add souces / qualifiers end...")
+
+        # items imported with their statements are synced by item_sync from the
+        # imported revision. The entity and diff modes raise when the edit is
+        # not saved; the other modes only log failed edits, so their items are
+        # tracked without a revision and imported again by the next sync.
+        if add_statements:
+            verified = write_mode in ["entity", "diff"]
+            lastrevid = item.latest_revision_id if verified else None
+            id_mapping.track_item(local_repo, qid, lastrevid)
+
+        lang = wd.get_claim_language(item_dict)
+        label = item_dict["labels"][lang]
+
+    return {
+        "id": local_item.id,
+        "label": label,
+        "item": local_item,
+        "api_calls": ledger.totals(),
+    }
@@ -0,0 +1,209 @@
+import copy
+
+import scripts.utils.wiki_json_serialization as wjs
+import scripts.utils.wiki_serialization as ws
+
+# These functions compare the wbeditentity data for an item that is created
+# from wikidata.org with the json of the local item, and create the smallest
+# wbeditentity data that makes the local item match. Snaks are compared by
+# (property, snak type, value), so snak hashes and statement ids don't matter.
+
+
+def get_snak_key(snak):
+    """hashable key for a snak json"""
+    value = snak.get("datavalue", {}).get("value")
+    return (snak["property"], snak["snaktype"], ws.freeze_value(value))
+
+
+def get_statement_key(statement):
+    return get_snak_key(statement["mainsnak"])
+
+
+def get_qualifier_keys(statement):
+    return {
+        get_snak_key(snak)
+        for snaks in statement.get("qualifiers", {}).values()
+        for snak in snaks
+    }
+
+
+def get_reference_key(reference):
+    """references are the same if they have the same snaks in any order"""
+    return frozenset(
+        get_snak_key(snak) for snaks in reference["snaks"].values() for snak in snaks
+    )
+
+
+def diff_terms(desired, local, allow_removals=False):
+    """create wbeditentity data for the labels, descriptions and aliases that
+    are different. desired and local are {field: {language: value}}
+    dictionaries, with a list of values for aliases."""
+    changes = {}
+    for field in ["labels", "descriptions"]:
+        want = desired.get(field, {})
+        have = local.get(field, {})
+        field_changes = {
+            lang: value for lang, value in want.items() if have.get(lang) != value
+        }
+        if allow_removals:
+            for lang in have.keys() - want.keys():
+                field_changes[lang] = {"language": lang, "remove": ""}
+        if field_changes:
+            changes[field] = field_changes
+
+    want = desired.get("aliases", {})
+    have = local.get("aliases", {})
+    langs = want.keys() | have.keys() if allow_removals else want.keys()
+    alias_changes = {}
+    for lang in sorted(langs):
+        want_values = want.get(lang, [])
+        have_values = have.get(lang, [])
+        lang_changes = [
+            {"language": lang, "value": value, "add": ""}
+            for value in want_values
+            if value not in have_values
+        ]
+        if allow_removals:
+            lang_changes += [
+                {"language": lang, "value": value, "remove": ""}
+                for value in have_values
+                if value not in want_values
+            ]
+        if lang_changes:
+            alias_changes[lang] = lang_changes
+    if alias_changes:
+        changes["aliases"] = alias_changes
+
+    return changes
+
+
+def merge_statement(statement, local_statement, allow_removals=False):
+    """get the updated json for a local statement that has the same main snak
+    as statement, or None if the statement doesn't need to change. The rank of
+    statement is used. Without allow_removals, the missing qualifiers and
+    references are added to the local statement; with allow_removals, the
+    local statement is replaced."""
+    local_qualifiers = get_qualifier_keys(local_statement)
+    local_references = {
+        get_reference_key(ref) for ref in local_statement.get("references", [])
+    }
+    rank = statement.get("rank", "normal")
+    rank_changed = rank != local_statement.get("rank", "normal")
+
+    if allow_removals:
+        references = {get_reference_key(ref) for ref in statement.get("references", [])}
+        if (
+            get_qualifier_keys(statement) == local_qualifiers
+            and references == local_references
+            and not rank_changed
+        ):
+            return
+        return {**statement, "id": local_statement["id"], "rank": rank}
+
+    new_qualifiers = [
+        snak
+        for snaks in statement.get("qualifiers", {}).values()
+        for snak in snaks
+        if get_snak_key(snak) not in local_qualifiers
+    ]
+    new_references = [
+        ref
+        for ref in statement.get("references", [])
+        if get_reference_key(ref) not in local_references
+    ]
+    if not new_qualifiers and not new_references and not rank_changed:
+        return
+
+    merged = copy.deepcopy(local_statement)
+    merged["rank"] = rank
+    for snak in new_qualifiers:
+        merged.setdefault("qualifiers", {}).setdefault(snak["property"], []).append(
+            snak
+        )
+        order = merged.setdefault("qualifiers-order", [])
+        if snak["property"] not in order:
+            order.append(snak["property"])
+    merged.setdefault("references", []).extend(new_references)
+    return merged
+
+
+def diff_statements(
+    statements, local_claims, allow_removals=False, incomplete_properties=()
+):
+    """create the wbeditentity claims for a list of statement json. Statements
+    that are not in local_claims ({property: [statement json]}) are added, and
+    statements with new qualifiers, new references or another rank are
+    updated. With allow_removals, local statements that are not in statements
+    are removed.
+
+    incomplete_properties are properties with wikidata.org claims, qualifiers
+    or references that could not be converted, so statements is missing some
+    of their values. Nothing is removed from the local statements of these
+    properties."""
+    local_statements = {}
+    for claims in local_claims.values():
+        for local_statement in claims:
+            key = get_statement_key(local_statement)
+            local_statements.setdefault(key, []).append(local_statement)
+
+    changes = []
+    matched_ids = set()
+    for statement in statements:
+        candidates = [
+            local_statement
+            for local_statement in local_statements.get(
+                get_statement_key(statement), []
+            )
+            if local_statement["id"] not in matched_ids
+        ]
+        if not candidates:
+            changes.append(statement)
+            continue
+
+        matched_ids.add(candidates[0]["id"])
+        complete = statement["mainsnak"]["property"] not in incomplete_properties
+        updated = merge_statement(statement, candidates[0], allow_removals and complete)
+        if updated:
+            changes.append(updated)
+
+    if allow_removals:
+        for property, claims in local_claims.items():
+            if property in incomplete_properties:
+                continue
+            for local_statement in claims:
+                if local_statement["id"] not in matched_ids:
+                    changes.append({"id": local_statement["id"], "remove": ""})
+
+    return changes
+
+
+def diff_entity(desired, local_json, allow_removals=False, incomplete_properties=()):
+    """create the wbeditentity data that changes the local item json into the
+    desired item data. desired has labels, descriptions and aliases as
+    {language: value} dictionaries, and claims as a list of statement json, the
+    same as build_local_entity_data. Returns an empty dictionary if the local
+    item is the same. incomplete_properties are passed to diff_statements."""
+    changes = diff_terms(desired, wjs.format_item_fields(local_json), allow_removals)
+
+    claims = diff_statements(
+        desired.get("claims", []),
+        local_json.get("claims", {}),
+        allow_removals,
+        incomplete_properties,
+    )
+    if claims:
+        changes["claims"] = claims
+
+    return changes
+
+
+def count_changes(changes):
+    """count the changed terms and statements in wbeditentity data"""
+    counts = {
+        field: len(changes.get(field, {})) for field in ["labels", "descriptions"]
+    }
+    counts["aliases"] = sum(
+        len(values) for values in changes.get("aliases", {}).values()
+    )
+    counts["claims"] = len(changes.get("claims", []))
+    return counts
@@ -0,0 +1,110 @@
+from pathlib import Path
+
+import scripts.utils.bulk_import as bulk_import
+import scripts.utils.id_mapping as id_mapping
+from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
+import scripts.utils.wiki_queries as wq
+
+SYNC_JOURNAL_PATH = id_mapping.data_dir / "sync_journal.jsonl"
+
+# Only the items that were imported with their statements are synced. They are
+# tracked with the imported revision by import_wikidata_item_to_local_wikibase;
+# units and stubs that are only used in claims are not tracked, so a sync does
+# not import more of the wikidata graph.
+#
+# The revisions are polled with one wbgetentities request for every 50 tracked
+# items. The recentchanges api can not be filtered by a list of items, and
+# wikidata has hundreds of thousands of edits a day, so paging through the
+# recent changes would take more requests than polling the tracked items.
+
+
+def get_tracked_qids(local_repo):
+    """get the qids of the items that were imported with their statements to
+    the local wikibase"""
+    return sorted(id_mapping.get_mapping_store().get_tracked(local_repo))
+
+
+def move_redirected_items(local_repo, redirects):
+    """items that were merged on wikidata.org redirect to the item they were
+    merged into. redirects is {redirected qid: target qid}. The local item of a
+    redirected qid is mapped to the target, unless the target already has a
+    local item, and the target is tracked instead of the redirected qid, so
+    the local item is synced with the target item."""
+    store = id_mapping.get_mapping_store()
+    tracked = store.get_tracked(local_repo)
+    for qid, target in redirects.items():
+        local_id = store.get(local_repo, qid)
+        if local_id and not store.get(local_repo, target):
+            store.set(local_repo, target, local_id)
+        if qid in tracked:
+            store.untrack(local_repo, qid)
+            if target not in tracked:
+                store.track_many(local_repo, {target: None})
+        logger.info(f"Sync: {qid} redirects to {target}")
+
+
+@metrics.timed
+def find_changed_items(site, local_repo, qids=None, max_workers=wq.MAX_WORKERS):
+    """get {qid: lastrevid} for the items whose wikidata.org revision is not
+    the imported revision. qids defaults to the tracked items. Items without
+    an imported revision, e.g. qids that are not tracked yet, are changed.
+    Redirected qids are replaced with their target qid."""
+    qids = get_tracked_qids(local_repo) if qids is None else list(qids)
+
+    entities = wq.fetch_and_format_entities(site, qids, "info", max_workers)
+    move_redirected_items(local_repo, wq.get_redirects(entities))
+
+    tracked = id_mapping.get_mapping_store().get_tracked(local_repo)
+    changed = {
+        entity["id"]: entity["lastrevid"]
+        for entity in entities.values()
+        if tracked.get(entity["id"]) != entity["lastrevid"]
+    }
+    logger.info(f"Sync: {len(changed)} of {len(qids)} items changed")
+    return changed
+
+
+@metrics.timed
+def sync_items(
+    site,
+    local_site,
+    local_site_url,
+    qids=None,
+    record_only=False,
+    journal_path=SYNC_JOURNAL_PATH,
+    write_mode="diff",
+    **import_kwargs,
+):
+    """import the tracked items that changed on wikidata.org again. qids are
+    the items to check; by default every tracked item is checked. The changed
+    items are imported with bulk_import, which saves the imported revision, so
+    failed items are tried again by the next sync. With record_only, the
+    current revisions are saved without importing, e.g. to track items that
+    were imported before items were tracked.
+
+    journal_path is the bulk_import journal for one sync, so a sync that
+    stopped can be run again. It is removed when the sync finishes.
+    import_kwargs are passed to bulk_import, e.g. allow_removals."""
+    local_repo = local_site.data_repository()
+    changed = find_changed_items(site, local_repo, qids)
+
+    summary = {"changed": len(changed)}
+    if record_only:
+        id_mapping.get_mapping_store().track_many(local_repo, changed)
+    elif changed:
+        summary.update(
+            bulk_import.bulk_import(
+                list(changed),
+                site,
+                local_site,
+                local_site_url,
+                journal_path=journal_path,
+                write_mode=write_mode,
+                **import_kwargs,
+            )
+        )
+        Path(journal_path).unlink(missing_ok=True)
+
+    logger.info(f"Sync finished: {summary}")
+    return summary
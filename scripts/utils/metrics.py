@@ -0,0 +1,217 @@
+from contextlib import contextmanager
+import contextvars
+from functools import wraps
+import json
+import logging
+from pathlib import Path
+import threading
+import time
+
+# upper bounds in seconds for the latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+# {(name, labels): value}
+counters = {}
+# {(name, labels): {"buckets": [...], "counts": [...], "sum": 0, "count": 0}}
+histograms = {}
+exporters = []
+lock = threading.Lock()
+
+
+def get_labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """add value to a counter"""
+    key = (name, get_labels_key(labels))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """add value to a histogram"""
+    key = (name, get_labels_key(labels))
+    with lock:
+        if key not in histograms:
+            histograms[key] = {
+                "buckets": buckets,
+                "counts": [0] * len(buckets),
+                "sum": 0,
+                "count": 0,
+            }
+        histogram = histograms[key]
+        for index, bucket in enumerate(histogram["buckets"]):
+            if value <= bucket:
+                histogram["counts"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def reset():
+    """remove all counters and histograms"""
+    with lock:
+        counters.clear()
+        histograms.clear()
+
+
+def get_phase():
+    """get the name of the innermost span, which is used as the phase for
+    network counters"""
+    record = current_span.get()
+    return record["name"] if record else "none"
+
+
+def record_request(endpoint, response_bytes, duration):
+    """count a network request for the current phase"""
+    phase = get_phase()
+    increment("http_requests_total", phase=phase, endpoint=endpoint)
+    increment(
+        "http_response_bytes_total", response_bytes, phase=phase, endpoint=endpoint
+    )
+    observe("http_request_duration_seconds", duration, endpoint=endpoint)
+
+    record = current_span.get()
+    if record:
+        with lock:
+            record["requests"] += 1
+            record["bytes"] += response_bytes
+
+
+@contextmanager
+def span(name):
+    """time a block of code. The duration is added to the span_duration_seconds
+    histogram and the span is sent to the exporters. Network requests made in
+    the block are counted for this span."""
+    parent = current_span.get()
+    record = {
+        "name": name,
+        "parent": parent["name"] if parent else None,
+        "start": time.time(),
+        "requests": 0,
+        "bytes": 0,
+    }
+    token = current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as err:
+        record["error"] = repr(err)
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start
+        current_span.reset(token)
+        observe("span_duration_seconds", record["duration"], span=name)
+
+        # include the requests of nested spans in the parent span
+        if parent:
+            with lock:
+                parent["requests"] += record["requests"]
+                parent["bytes"] += record["bytes"]
+
+        for exporter in exporters:
+            exporter(record)
+
+
+def timed(func):
+    """decorator that runs a function in a span with the function name"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def run_in_context(executor, func, *args):
+    """submit func to a thread pool so that it runs in the current span.
+    Threads don't inherit context variables, so the context is copied."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def add_exporter(exporter):
+    """exporter is called with the record for every finished span"""
+    exporters.append(exporter)
+    return exporter
+
+
+def remove_exporter(exporter):
+    if exporter in exporters:
+        exporters.remove(exporter)
+
+
+class LoggerExporter:
+    """log every finished span"""
+
+    def __init__(self, logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, record):
+        self.logger.log(
+            self.level,
+            f"{record['name']}: {record['duration']:.3f}s "
+            f"{record['requests']} requests {record['bytes']} bytes",
+        )
+
+
+class JsonLinesExporter:
+    """write every finished span as a line of json"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    text = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + text + "}"
+
+
+def format_prometheus():
+    """format the counters and histograms in prometheus text format"""
+    lines = []
+    with lock:
+        counter_items = sorted(counters.items())
+        histogram_items = sorted(histograms.items(), key=lambda item: item[0])
+
+        names = set()
+        for (name, labels), value in counter_items:
+            if name not in names:
+                lines.append(f"# TYPE {name} counter")
+                names.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histogram_items:
+            if name not in names:
+                lines.append(f"# TYPE {name} histogram")
+                names.add(name)
+            for bucket, count in zip(histogram["buckets"], histogram["counts"]):
+                bucket_labels = labels + (("le", str(bucket)),)
+                lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+            inf_labels = labels + (("le", "+Inf"),)
+            lines.append(
+                f"{name}_bucket{format_labels(inf_labels)} {histogram['count']}"
+            )
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """write the counters and histograms to a file in prometheus text format,
+    e.g. for the node exporter textfile collector"""
+    with open(path, "w") as f:
+        f.write(format_prometheus())
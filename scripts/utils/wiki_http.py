@@ -0,0 +1,313 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from functools import wraps
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pywikibot
+from pywikibot.comms import http as pywikibot_http
+import requests
+from requests.adapters import HTTPAdapter
+from pywikibot.data import api
+
+import scripts.utils.call_ledger as call_ledger
+from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
+
+USER_AGENT = (
+    "WikiDataIntegration/1.0 "
+    "(https://github.com/collectiveaccess/WikiDataIntegration)"
+)
+# number of hosts to keep connection pools for, and number of connections to
+# keep open per host
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 20
+# (connect, read) timeout in seconds. the query service stops queries after
+# 60 seconds, so the read timeout is a little longer than that.
+DEFAULT_TIMEOUT = (10, 70)
+
+# retry failed requests with exponential backoff. the delay before retry n
+# is a random number between 0 and BACKOFF_FACTOR * 2 ** n seconds, up to
+# MAX_BACKOFF seconds. Retry-After headers are used instead when the server
+# sends them.
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 1
+MAX_BACKOFF = 120
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# mediawiki api requests fail with a maxlag error when the database
+# replication lag is more than MAXLAG seconds
+# https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+MAXLAG = 5
+# (requests per second, burst size) for each host
+DEFAULT_RATE_LIMIT = (10, 10)
+RATE_LIMITS = {"query.wikidata.org": (1, 5)}
+# api actions that edit a wiki. They are counted as edits in the call ledger.
+EDIT_ACTIONS = [
+    "edit",
+    "wbeditentity",
+    "wbsetclaim",
+    "wbcreateclaim",
+    "wbsetclaimvalue",
+    "wbremoveclaims",
+    "wbsetqualifier",
+    "wbremovequalifiers",
+    "wbsetreference",
+    "wbremovereferences",
+    "wbsetlabel",
+    "wbsetdescription",
+    "wbsetaliases",
+    "wbsetsitelink",
+]
+
+session = None
+timeout = DEFAULT_TIMEOUT
+max_retries = MAX_RETRIES
+backoff_factor = BACKOFF_FACTOR
+max_backoff = MAX_BACKOFF
+maxlag = MAXLAG
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """rate limiter that allows rate requests per second on average, with bursts
+    of up to capacity requests"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """wait until a request is allowed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(
+    pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, user_agent=USER_AGENT
+):
+    """create a requests session that keeps connections alive and reuses them
+    for every request to the same host"""
+    new_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    new_session.headers.update({"User-Agent": user_agent})
+    return new_session
+
+
+def configure_session(
+    pool_connections=POOL_CONNECTIONS,
+    pool_maxsize=POOL_MAXSIZE,
+    default_timeout=DEFAULT_TIMEOUT,
+    user_agent=USER_AGENT,
+):
+    """replace the shared session used by wiki_queries"""
+    global session, timeout
+    if session is not None:
+        session.close()
+    session = create_session(pool_connections, pool_maxsize, user_agent)
+    timeout = default_timeout
+    return session
+
+
+def get_session():
+    if session is None:
+        configure_session()
+    return session
+
+
+def configure_request_policy(
+    retries=MAX_RETRIES,
+    backoff=BACKOFF_FACTOR,
+    backoff_limit=MAX_BACKOFF,
+    lag=MAXLAG,
+):
+    """change how failed requests are retried. pywikibot api requests use
+    pywikibot's own retries, so the same limits are set in pywikibot config."""
+    global max_retries, backoff_factor, max_backoff, maxlag
+    max_retries = retries
+    backoff_factor = backoff
+    max_backoff = backoff_limit
+    maxlag = lag
+
+    pywikibot.config.max_retries = retries
+    pywikibot.config.maxlag = lag
+
+
+def configure_rate_limit(host, rate, capacity):
+    """allow rate requests per second to a host, with bursts of up to capacity
+    requests"""
+    RATE_LIMITS[host] = (rate, capacity)
+    with rate_limiters_lock:
+        rate_limiters[host] = TokenBucket(rate, capacity)
+
+
+def get_rate_limiter(host):
+    with rate_limiters_lock:
+        if host not in rate_limiters:
+            rate, capacity = RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+            rate_limiters[host] = TokenBucket(rate, capacity)
+        return rate_limiters[host]
+
+
+def get_backoff(attempt):
+    """exponential backoff with full jitter"""
+    return random.uniform(0, min(max_backoff, backoff_factor * 2**attempt))
+
+
+def get_retry_after(response):
+    """get the number of seconds in the Retry-After header. The header is
+    either a number of seconds or a date."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        retry_date = parsedate_to_datetime(value)
+        return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_delay(response, attempt):
+    """get the number of seconds to wait before retrying a request, or None if
+    the request should not be retried"""
+    # mediawiki returns maxlag errors with status 200 and X-Database-Lag header
+    is_maxlag = "X-Database-Lag" in response.headers
+    if response.status_code not in RETRY_STATUS_CODES and not is_maxlag:
+        return None
+
+    retry_after = get_retry_after(response)
+    if retry_after is not None:
+        return min(retry_after, max_backoff)
+    return get_backoff(attempt)
+
+
+def request(method, url, **kwargs):
+    """send a request with the shared session. Uses the default timeout if no
+    timeout is given. Requests are rate limited per host, and requests that
+    fail because of connection errors, rate limits, server errors or maxlag are
+    retried. Every attempt is counted in the current call ledger."""
+    kwargs.setdefault("timeout", timeout)
+    host = urlparse(url).hostname
+    rate_limiter = get_rate_limiter(host)
+
+    attempt = 0
+    while True:
+        call_ledger.record_call(host)
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+            record_response(url, response, time.perf_counter() - start)
+        except (requests.ConnectionError, requests.Timeout) as err:
+            if attempt >= max_retries:
+                raise
+            delay = get_backoff(attempt)
+            logger.warning(f"Retrying {method} {url} in {delay:.1f}s: {err}")
+        else:
+            delay = get_retry_delay(response, attempt)
+            if delay is None or attempt >= max_retries:
+                return response
+            logger.warning(
+                f"Retrying {method} {url} in {delay:.1f}s: {response.status_code}"
+            )
+
+        time.sleep(delay)
+        attempt += 1
+
+
+def record_response(url, response, duration, stream=False):
+    """count a request in the metrics for the current phase. The body of a
+    streamed response is not read, so only the Content-Length is counted."""
+    if stream:
+        response_bytes = int(response.headers.get("Content-Length") or 0)
+    else:
+        response_bytes = len(response.content or b"")
+    metrics.record_request(urlparse(url).hostname, response_bytes, duration)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def submit_api_request(site, params):
+    """send a request to the api of a pywikibot site. pywikibot keeps its own
+    session with keep-alive for each site, so these requests already reuse
+    connections. pywikibot handles maxlag and retries for these requests. The
+    request is rate limited and counted in the metrics by the pywikibot fetch
+    hook."""
+    api_request = api.Request(site=site, parameters=params)
+    return api_request.submit()
+
+
+def get_api_action(uri, data=None):
+    """get the action of a mediawiki api request from the url or the post
+    body"""
+    params = parse_qs(urlparse(uri).query)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="ignore")
+    if isinstance(data, str):
+        params.update(parse_qs(data))
+    elif isinstance(data, dict):
+        params.update({k: [v] for k, v in data.items()})
+
+    action = params.get("action")
+    return action[0] if action else None
+
+
+def install_pywikibot_hook():
+    """wrap pywikibot's http fetch so every request pywikibot makes, e.g. api
+    requests, edits and claim.target.get(), is counted in the metrics and the
+    current call ledger, and waits for the rate limiter of its host"""
+    fetch = pywikibot_http.fetch
+    if getattr(fetch, "metrics_hook", False):
+        return
+
+    @wraps(fetch)
+    def fetch_with_metrics(uri, *args, **kwargs):
+        is_edit = get_api_action(uri, kwargs.get("data")) in EDIT_ACTIONS
+        host = urlparse(uri).hostname
+        call_ledger.record_call(host, is_edit)
+        if is_edit:
+            metrics.increment("wiki_edits_total", endpoint=host)
+        get_rate_limiter(host).acquire()
+        start = time.perf_counter()
+        response = fetch(uri, *args, **kwargs)
+        # pywikibot returns the exception instead of a response when the
+        # request fails
+        if isinstance(response, requests.Response):
+            stream = kwargs.get("stream", False)
+            record_response(uri, response, time.perf_counter() - start, stream)
+        return response
+
+    fetch_with_metrics.metrics_hook = True
+    pywikibot_http.fetch = fetch_with_metrics
+
+
+install_pywikibot_hook()
@@ -0,0 +1,385 @@
+from decimal import Decimal
+import re
+
+import pywikibot
+
+import scripts.utils.wiki_serialization as ws
+
+# These functions serialize items from the wbgetentities json without creating
+# pywikibot ItemPage and Claim objects. The output is the same as the
+# functions in wiki_serialization and wikidata_utils that use pywikibot objects.
+
+# namespace prefix for entity titles, e.g. "" for Q ids on wikidata.org and
+# "Item:" for Q ids on a local wikibase. keyed by (repo, entity type letter)
+entity_title_prefixes = {}
+
+ENTITY_PAGE_CLASSES = {
+    "Q": pywikibot.ItemPage,
+    "P": pywikibot.PropertyPage,
+    "L": pywikibot.LexemePage,
+}
+
+
+def get_entity_title_prefix(repo, entity_id):
+    """get the namespace prefix for an entity title. The prefix is only looked
+    up once for each repo and entity type."""
+    key = (str(repo), entity_id[0])
+    if key not in entity_title_prefixes:
+        page = ENTITY_PAGE_CLASSES[entity_id[0]](repo, entity_id)
+        title = page.title(as_url=True)
+        entity_title_prefixes[key] = title[: -len(entity_id)]
+    return entity_title_prefixes[key]
+
+
+def get_entity_url(repo, entity_id):
+    """same as pywikibot full_url() for an entity page"""
+    title = get_entity_title_prefix(repo, entity_id) + entity_id
+    return repo.base_url(repo.articlepath.format(title))
+
+
+def get_snak_type(snak):
+    return snak.get("datatype")
+
+
+def get_snak_value(snak):
+    """get the datavalue for a snak. Returns None for somevalue and novalue
+    snaks, the same as pywikibot claim.target."""
+    if snak["snaktype"] != "value":
+        return None
+    return snak["datavalue"]["value"]
+
+
+def get_entity_id(snak):
+    """get the id for wikibase-item and wikibase-property snaks"""
+    value = get_snak_value(snak)
+    prefix = "P" if get_snak_type(snak) == "wikibase-property" else "Q"
+    return prefix + str(value["numeric-id"])
+
+
+def get_commons_media_title(value):
+    """same as pywikibot FilePage title() for a commonsMedia value"""
+    return "File:" + value
+
+
+def get_quantity_bounds(value):
+    """pywikibot creates the bounds from the amount and the error, so the
+    bounds are calculated the same way to get the same decimal exponents"""
+    amount = Decimal(str(value["amount"]))
+    if value.get("upperBound") is None or value.get("lowerBound") is None:
+        return amount, None, None
+
+    upper = Decimal(str(value["upperBound"]))
+    lower = Decimal(str(value["lowerBound"]))
+    return amount, amount + (upper - amount), amount - (amount - lower)
+
+
+def format_time_value(value):
+    """same as pywikibot WbTime toTimestr()"""
+    match = re.match(r"([-+]?\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)Z", value["time"])
+    if not match:
+        raise ValueError("Invalid format: '{}'".format(value["time"]))
+    t = [int(part) for part in match.groups()]
+    return pywikibot.WbTime.FORMATSTR.format(*t)
+
+
+def get_snak_label(snak, ids_dict, repo, lexemes, include_qid=False):
+    """get the label info that shown on the site for a snak. Same as
+    wiki_serialization.get_claim_label."""
+    value = get_snak_value(snak)
+    if not value:
+        return
+
+    snak_type = get_snak_type(snak)
+
+    if snak_type in ["wikibase-item", "wikibase-property"]:
+        id = get_entity_id(snak)
+        label = ids_dict[id]
+
+        if include_qid:
+            return id + " " + label
+        else:
+            return label
+
+    elif snak_type == "wikibase-lexeme":
+        claim_dict = {"labels": lexemes[value["id"]]}
+        lang = ws.get_claim_language(claim_dict)
+        label = claim_dict["labels"][lang]
+
+        return {
+            "label": label,
+            "id": value["id"],
+            "url": get_entity_url(repo, value["id"]),
+        }
+
+    elif snak_type == "globe-coordinate":
+        return {"latitude": value["latitude"], "longitude": value["longitude"]}
+
+    elif snak_type == "geo-shape":
+        page = pywikibot.Page(repo.geo_shape_repository(), value)
+        return {"label": page.title(), "url": page.full_url()}
+
+    elif snak_type == "commonsMedia":
+        return get_commons_media_title(value)
+
+    elif snak_type == "quantity":
+        amount, upper, lower = get_quantity_bounds(value)
+        data = {
+            "amount": amount.to_eng_string(),
+        }
+        if lower:
+            data["lowerBound"] = lower.to_eng_string()
+        if lower:
+            data["upperBound"] = upper.to_eng_string()
+        if value["unit"] != "1":
+            id = value["unit"].split("/")[-1]
+            data["unit"] = ids_dict[id]
+
+        return data
+
+    elif snak_type == "time":
+        return format_time_value(value)
+
+    elif snak_type == "monolingualtext":
+        return value["text"]
+
+    else:
+        return value
+
+
+def format_snak_data(
+    snak, prop, id_label_dict, media_metadata, external_id_links, repo, lexemes
+):
+    """created a nested dictionary for a snak. Same as
+    wiki_serialization.format_claim_data."""
+    snak_type = get_snak_type(snak)
+    value = get_snak_value(snak)
+    data = {
+        "property": prop,
+        "property_value": id_label_dict[prop],
+        "data_type": snak_type,
+        "data_value": {"value": {}},
+    }
+
+    if snak_type in ["wikibase-item", "wikibase-property"]:
+        if value:
+            id = get_entity_id(snak)
+            data["data_value"]["value"]["label"] = id_label_dict[id]
+            data["data_value"]["value"]["id"] = id
+            data["data_value"]["value"]["url"] = get_entity_url(repo, id)
+
+    elif snak_type == "commonsMedia":
+        if value:
+            file_name = get_commons_media_title(value)
+            data["data_value"]["value"] = media_metadata[file_name]
+
+    elif snak_type == "external-id":
+        url = external_id_links[prop] if prop in external_id_links else None
+        data["data_value"]["value"]["label"] = get_snak_label(
+            snak, id_label_dict, repo, lexemes
+        )
+        data["data_value"]["value"]["url"] = url
+
+    else:
+        data["data_value"]["value"] = get_snak_label(snak, id_label_dict, repo, lexemes)
+
+    return data
+
+
+def format_item_claims(
+    item_json, id_label_dict, media_metadata, external_id_links, repo, lexemes=None
+):
+    """created a nested dictionary for an item's claims, references, and
+    qualifiers. Same as wiki_serialization.format_item_claims."""
+    lexemes = lexemes or {}
+    statements = {}
+    identifiers = {}
+    for prop, claims in item_json.get("claims", {}).items():
+        # separate claims into identifiers and statements
+        is_identifier = get_snak_type(claims[0]["mainsnak"]) == "external-id"
+        if is_identifier:
+            identifiers[prop] = []
+        else:
+            statements[prop] = []
+
+        for claim in claims:
+            # process the main claim
+            claim_data = {
+                **format_snak_data(
+                    claim["mainsnak"],
+                    prop,
+                    id_label_dict,
+                    media_metadata,
+                    external_id_links,
+                    repo,
+                    lexemes,
+                ),
+                "id": claim.get("id"),
+            }
+
+            # process qualifiers for a claim
+            if claim.get("qualifiers"):
+                claim_data["qualifiers"] = {}
+                for prop_q in claim["qualifiers-order"]:
+                    claim_data["qualifiers"][prop_q] = []
+                    for qualifier in claim["qualifiers"][prop_q]:
+                        qualifier_data = format_snak_data(
+                            qualifier,
+                            prop_q,
+                            id_label_dict,
+                            media_metadata,
+                            external_id_links,
+                            repo,
+                            lexemes,
+                        )
+                        claim_data["qualifiers"][prop_q].append(qualifier_data)
+
+            # process references for a claim
+            if claim.get("references"):
+                claim_data["references"] = []
+            for source in claim.get("references", []):
+                source_dict_data = {}
+                for prop_s in source.get("snaks-order", source["snaks"].keys()):
+                    source_dict_data[prop_s] = []
+                    for source_snak in source["snaks"][prop_s]:
+                        source_data = format_snak_data(
+                            source_snak,
+                            prop_s,
+                            id_label_dict,
+                            media_metadata,
+                            external_id_links,
+                            repo,
+                            lexemes,
+                        )
+                        source_dict_data[prop_s].append(source_data)
+
+                claim_data["references"].append(source_dict_data)
+
+            if is_identifier:
+                identifiers[prop].append(claim_data)
+            else:
+                statements[prop].append(claim_data)
+
+    return {"statements": statements, "identifiers": identifiers}
+
+
+def iterate_snaks(item_json):
+    """yield every main snak, qualifier snak and reference snak in an item"""
+    for claims in item_json.get("claims", {}).values():
+        for claim in claims:
+            yield claim["mainsnak"]
+            for qualifiers in claim.get("qualifiers", {}).values():
+                yield from qualifiers
+            for source in claim.get("references", []):
+                for source_snaks in source["snaks"].values():
+                    yield from source_snaks
+
+
+def add_nested_ids(snak, claim_ids):
+    """get q ids for certain snak types"""
+    snak_type = get_snak_type(snak)
+    value = get_snak_value(snak)
+    if not value:
+        return
+
+    if snak_type == "wikibase-item":
+        claim_ids.add(get_entity_id(snak))
+
+    if snak_type == "quantity" and value["unit"] != "1":
+        # unit is the url for wikidata item record
+        claim_ids.add(value["unit"].split("/")[-1])
+
+
+def get_ids_for_item(item_json, include_pids=True, include_qids=True):
+    """iterate through an item to get all item Q ids and property P ids"""
+    claim_ids = set()
+
+    for snak in iterate_snaks(item_json):
+        if include_pids:
+            claim_ids.add(snak["property"])
+            if get_snak_type(snak) == "wikibase-property" and get_snak_value(snak):
+                claim_ids.add(get_entity_id(snak))
+
+        if include_qids:
+            add_nested_ids(snak, claim_ids)
+
+    return list(claim_ids)
+
+
+def get_commons_media_for_item(item_json):
+    """iterate through an item to get all commons media"""
+    media = set()
+
+    for snak in iterate_snaks(item_json):
+        value = get_snak_value(snak)
+        if get_snak_type(snak) == "commonsMedia" and value:
+            media.add(get_commons_media_title(value))
+
+    return list(media)
+
+
+def get_lexeme_ids_for_item(item_json):
+    """iterate through an item to get all lexeme L ids"""
+    lexeme_ids = set()
+
+    for snak in iterate_snaks(item_json):
+        value = get_snak_value(snak)
+        if get_snak_type(snak) == "wikibase-lexeme" and value:
+            lexeme_ids.add(value["id"])
+
+    return list(lexeme_ids)
+
+
+def get_all_language_codes_for_item(item_json):
+    """get all the language codes in an item"""
+    item_lang_codes = set()
+
+    for field in ["labels", "descriptions", "aliases"]:
+        item_lang_codes.update(item_json.get(field, {}).keys())
+
+    return item_lang_codes
+
+
+def format_item_fields(item_json):
+    """reshape json to create {language: value} dictionary. pywikibot toJSON()
+    leaves out empty fields, so empty fields are skipped."""
+    data = {}
+    for field in ["labels", "descriptions", "aliases"]:
+        if item_json.get(field):
+            if field == "aliases":
+                data[field] = ws.format_item_aliases(item_json)
+            else:
+                data[field] = ws.format_item_field(item_json, field)
+    return data
+
+
+def find_differences(expected, actual, path="data", check_order=True):
+    """list the paths where the output of the pywikibot functions (expected)
+    and the json functions (actual) are different. check_order also compares
+    the order of dictionary keys."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in expected.keys() | actual.keys():
+            if key not in actual:
+                differences.append(f"{path}[{key!r}] missing from json path")
+            elif key not in expected:
+                differences.append(f"{path}[{key!r}] missing from pywikibot path")
+            else:
+                differences += find_differences(
+                    expected[key], actual[key], f"{path}[{key!r}]", check_order
+                )
+        # the order of properties, qualifiers and references is shown on the site
+        if check_order and not differences and list(expected) != list(actual):
+            differences.append(f"{path}: key order {list(expected)} != {list(actual)}")
+        return differences
+
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [f"{path}: {len(expected)} != {len(actual)} values"]
+        differences = []
+        for index, (e, a) in enumerate(zip(expected, actual)):
+            differences += find_differences(e, a, f"{path}[{index}]", check_order)
+        return differences
+
+    if expected != actual:
+        return [f"{path}: {expected!r} != {actual!r}"]
+    return []
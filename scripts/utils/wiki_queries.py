@@ -1,10 +1,71 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
 import json
-from pywikibot.data import api
+from pathlib import Path
+import threading
+
+from scripts.utils.cache import create_cache
+import scripts.utils.call_ledger as call_ledger
+from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
+import scripts.utils.wiki_http as wh
 
 WIKI_BASE_URL = "https://www.wikidata.org"
 WIKI_QUERY_URL = "https://query.wikidata.org/sparql"
 
+# wikidata API has max limit of 50 ids or titles per request
+API_MAX_IDS = 50
+# number of chunks of ids to request at the same time
+MAX_WORKERS = 4
+
+constants_path = Path(__file__).resolve().parent.parent / "constants"
+EXTERNAL_ID_FORMATTER_URLS_PATH = (
+    constants_path / "wikdata_external_id_formatter_urls.json"
+)
+
+external_id_formatter_urls = None
+external_id_formatter_urls_lock = threading.Lock()
+
+# labels for Q ids and P ids rarely change, so keep them for a week
+LABEL_CACHE_SIZE = 50000
+LABEL_CACHE_DISK_SIZE = 1000000
+LABEL_CACHE_TTL = 7 * 24 * 60 * 60
+
+label_cache = None
+
+# the list of wikidata content languages rarely changes, so only refresh it
+# once a day
+LANGUAGES_REFRESH_INTERVAL = 24 * 60 * 60
+
+languages_cache = None
+
+COMMONS_THUMB_WIDTH = 300
+# commons media metadata only changes when a new version of a file is
+# uploaded, so only check the metadata again after 30 days
+COMMONS_MEDIA_CACHE_SIZE = 10000
+COMMONS_MEDIA_CACHE_DISK_SIZE = 500000
+COMMONS_MEDIA_CACHE_TTL = 30 * 24 * 60 * 60
+
+commons_media_cache = None
+
+
+def chunk_list(values, chunk_size=API_MAX_IDS):
+    """split a list into multiple lists with up to chunk_size values"""
+    values = list(values)
+    return [values[i : i + chunk_size] for i in range(0, len(values), chunk_size)]
+
+
+def map_concurrently(func, values, max_workers=MAX_WORKERS):
+    """call func for every value and return the results in the same order as
+    values. Uses a thread pool when max_workers is more than one. If a call
+    raises an exception, the first exception in order is raised. The calls run
+    in the current metrics span."""
+    if max_workers <= 1 or len(values) <= 1:
+        return [func(value) for value in values]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(values))) as executor:
+        futures = [metrics.run_in_context(executor, func, value) for value in values]
+        return [future.result() for future in futures]
+
 
 def fetch_search_results(site, keyword, language="en"):
     """search wikidata for a given keyword"""
@@ -18,8 +79,7 @@ def fetch_search_results(site, keyword, language="en"):
         "type": "item",
         "search": keyword,
     }
-    api_request = api.Request(site=site, parameters=params)
-    result = api_request.submit()
+    result = wh.submit_api_request(site, params)
 
     return result["search"]
 
@@ -62,16 +122,18 @@ def format_search_results(results, language="en"):
     return tmp
 
 
+@metrics.timed
 def search_keyword(site, keyword, language="en"):
     results = fetch_search_results(site, keyword, language)
     return format_search_results(results, language)
 
 
+@metrics.timed
 def wikidata_query(query):
     # https://stackoverflow.com/a/66223213
     try:
         headers = {"Content-Type": "application/sparql-query"}
-        response = requests.post(
+        response = wh.post(
             WIKI_QUERY_URL, data=query, headers=headers, params={"format": "json"}
         )
         return response.json()["results"]["bindings"]
@@ -117,6 +179,7 @@ def fetch_all_properties():
     return wikidata_query(query)
 
 
+@metrics.timed
 def fetch_and_format_all_properties():
     results = fetch_all_properties()
     return format_wikidata_properties_results(results)
@@ -138,12 +201,71 @@ def fetch_external_id_properties():
     return wikidata_query(query)
 
 
+@metrics.timed
 def fetch_and_format_external_id_properties():
     results = fetch_external_id_properties()
     return format_wikidata_properties_results(results)
 
 
-def fetch_labels_for_ids_sqarql(ids):
+def configure_label_cache(
+    maxsize=LABEL_CACHE_SIZE,
+    disk_maxsize=LABEL_CACHE_DISK_SIZE,
+    ttl=LABEL_CACHE_TTL,
+    persist=True,
+):
+    """replace the label cache. Labels are kept in memory, and in
+    cache/labels.sqlite3 when persist is True."""
+    global label_cache
+    label_cache = create_cache(
+        "labels", maxsize=maxsize, disk_maxsize=disk_maxsize, ttl=ttl, persist=persist
+    )
+    return label_cache
+
+
+def get_label_cache():
+    if label_cache is None:
+        configure_label_cache()
+    return label_cache
+
+
+def fetch_cached_labels(ids, source, langs, fetch):
+    """get {id: {lang: label}} for ids from the label cache. fetch(missing_ids)
+    is called to get the labels for the ids that are not in the cache for
+    every language. Ids that fetch does not return are cached as None, so they
+    are not requested again until the ttl expires, and are left out of the
+    results."""
+    cache = get_label_cache()
+    keys = {(id, lang): f"{source}|{lang}|{id}" for id in ids for lang in langs}
+    cached = cache.get_many(keys.values())
+
+    data = {}
+    missing = []
+    for id in dict.fromkeys(ids):
+        if not all(keys[(id, lang)] in cached for lang in langs):
+            missing.append(id)
+            continue
+        labels = {lang: cached[keys[(id, lang)]] for lang in langs}
+        if any(label is not None for label in labels.values()):
+            data[id] = labels
+
+    if len(missing) > 0:
+        results = fetch(missing)
+        new_entries = {
+            keys[(id, lang)]: label
+            for id, labels in results.items()
+            for lang, label in labels.items()
+            if (id, lang) in keys
+        }
+        for id in missing:
+            for lang in langs:
+                new_entries.setdefault(keys[(id, lang)], None)
+        cache.set_many(new_entries)
+        data.update(results)
+
+    return data
+
+
+def fetch_labels_for_ids_sqarql(ids, lang="en"):
     """
     get labels for a given list of Q ids and property ids from wikidata using
     sparql.
@@ -155,79 +277,181 @@ def fetch_labels_for_ids_sqarql(ids):
     SELECT ?item ?itemLabel WHERE {
         VALUES ?item { %s }
 
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "en". }
+        SERVICE wikibase:label { bd:serviceParam wikibase:language "%s". }
     }
-    """ % " ".join(
-        ["wd:" + id for id in ids]
+    """ % (
+        " ".join(["wd:" + id for id in ids]),
+        lang,
     )
 
     return wikidata_query(query)
 
 
-def fetch_and_format_labels_for_ids_sqarql(ids):
+@metrics.timed
+def fetch_and_format_labels_for_ids_sqarql(ids, lang="en", use_cache=True):
     if len(ids) == 0:
         return {}
 
-    results = fetch_labels_for_ids_sqarql(ids)
+    # only send the ids that are not in the label cache to wikidata
+    if use_cache:
+        data = fetch_cached_labels(
+            ids,
+            "sparql",
+            [lang],
+            lambda missing: {
+                id: {lang: label}
+                for id, label in fetch_and_format_labels_for_ids_sqarql(
+                    missing, lang, use_cache=False
+                ).items()
+            },
+        )
+        return {id: labels[lang] for id, labels in data.items()}
+
+    results = fetch_labels_for_ids_sqarql(ids, lang)
     return format_wikidata_items_results(results)
 
 
-def fetch_and_format_labels_for_ids(ids, url=WIKI_BASE_URL, lang="en"):
+def fetch_labels_for_ids(ids, url=WIKI_BASE_URL, langs=("en",)):
     """
-    get labels for a given list of Q ids and property ids from wikidata
+    get labels in one or more languages for up to 50 Q ids and property ids
+    from wikidata
 
     https://stackoverflow.com/questions/29179564/get-description-of-a-wikidata-property
     https://www.wikidata.org/w/api.php?action=help&modules=wbgetentities
     """
+    ids_str = "|".join(ids)
+    langs_str = "|".join(langs)
+    link = (
+        f"{url}/w/api.php?action=wbgetentities"
+        f"&ids={ids_str}&props=labels&languages={langs_str}&format=json"
+        f"&maxlag={wh.maxlag}"
+    )
+    response = wh.get(link)
 
-    # split ids list into multiple lists because wikidata API has max limit of 50 ids
-    chunk_size = 50
-    chunked_list = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    if response.status_code == 200:
+        json = response.json()
+        if "error" not in json:
+            return json["entities"]
+        else:
+            raise ValueError(json["error"]["info"])
+    else:
+        raise ValueError("Could not get labels for ids from wikidata API.")
 
+
+def format_labels_for_ids_results(results, langs):
+    """create {id: {lang: label}} dictionary for wbgetentities results"""
     data = {}
+    for prop, value in results.items():
+        data[prop] = {}
+        for lang in langs:
+            if "labels" in value and lang in value["labels"]:
+                data[prop][lang] = value["labels"][lang]["value"]
+            else:
+                data[prop][lang] = ""
+
+    return data
 
-    for chunk_ids in chunked_list:
-        ids_str = "|".join(chunk_ids)
-        link = (
-            f"{url}/w/api.php?action=wbgetentities"
-            f"&ids={ids_str}&props=labels&languages={lang}&format=json"
+
+def fetch_and_format_labels_for_ids_languages(
+    ids, url=WIKI_BASE_URL, langs=("en",), max_workers=MAX_WORKERS
+):
+    """get {id: {lang: label}} for a list of ids. The ids are split into chunks
+    of 50, and up to max_workers chunks are requested at the same time."""
+    chunked_list = chunk_list(ids, API_MAX_IDS)
+    results = map_concurrently(
+        lambda chunk_ids: fetch_labels_for_ids(chunk_ids, url, langs),
+        chunked_list,
+        max_workers,
+    )
+
+    data = {}
+    for chunk_results in results:
+        data.update(format_labels_for_ids_results(chunk_results, langs))
+
+    return data
+
+
+@metrics.timed
+def fetch_and_format_labels_for_ids(
+    ids, url=WIKI_BASE_URL, lang="en", use_cache=True, max_workers=MAX_WORKERS
+):
+    """
+    get labels for a given list of Q ids and property ids from wikidata.
+
+    lang is a language code, or a list of language codes to get the labels for
+    several languages with the same requests. Returns {id: label} for one
+    language code, and {id: {lang: label}} for a list of language codes.
+    """
+    langs = [lang] if isinstance(lang, str) else list(lang)
+
+    if len(ids) == 0:
+        data = {}
+    # only send the ids that are not in the label cache to the API
+    elif use_cache:
+        data = fetch_cached_labels(
+            ids,
+            url,
+            langs,
+            lambda missing: fetch_and_format_labels_for_ids_languages(
+                missing, url, langs, max_workers
+            ),
         )
-        response = requests.get(link)
-
-        if response.status_code == 200:
-            json = response.json()
-            if "error" not in json:
-                results = json["entities"]
-                for prop, value in results.items():
-                    if "labels" in value and lang in value["labels"]:
-                        data[prop] = value["labels"][lang]["value"]
-                    else:
-                        data[prop] = ""
-            else:
-                raise ValueError(json["error"]["info"])
-        else:
-            raise ValueError("Could not get labels for ids from wikidata API.")
+    else:
+        data = fetch_and_format_labels_for_ids_languages(ids, url, langs, max_workers)
 
+    if isinstance(lang, str):
+        return {id: labels[lang] for id, labels in data.items()}
     return data
 
 
-def fetch_commons_media_metadata(site, files):
-    """search wikimedia for commons media files and return the metadata"""
+def fetch_commons_media_metadata_chunk(site, files, thumb_width=COMMONS_THUMB_WIDTH):
+    """search wikimedia for up to 50 commons media files and return the
+    metadata. Follows the api continuation until every file is returned."""
     params = {
         "action": "query",
         "prop": "imageinfo",
         "format": "json",
         "iiprop": "url|size|mime|thumbmime|mediatype",
-        "iiurlwidth": 300,
+        "iiurlwidth": thumb_width,
         "titles": "|".join(files),
     }
-    api_request = api.Request(site=site, parameters=params)
-    results = api_request.submit()
-    if "pages" in results["query"]:
-        return list(results["query"]["pages"].values())
-    else:
+
+    pages = {}
+    while True:
+        results = wh.submit_api_request(site, params)
+        if "query" in results and "pages" in results["query"]:
+            for page in results["query"]["pages"].values():
+                # a file can be returned without imageinfo, and get its
+                # imageinfo in a later continuation
+                if page["title"] not in pages or "imageinfo" in page:
+                    pages[page["title"]] = page
+
+        if "continue" not in results:
+            break
+        params = {**params, **results["continue"]}
+
+    return list(pages.values())
+
+
+def fetch_commons_media_metadata(
+    site, files, max_workers=MAX_WORKERS, thumb_width=COMMONS_THUMB_WIDTH
+):
+    """search wikimedia for commons media files and return the metadata. The
+    api only accepts 50 titles per request, so the files are split into chunks
+    of 50, and up to max_workers chunks are requested at the same time."""
+    files = list(dict.fromkeys(files))
+    if len(files) == 0:
         return []
 
+    results = map_concurrently(
+        lambda chunk_files: fetch_commons_media_metadata_chunk(
+            site, chunk_files, thumb_width
+        ),
+        chunk_list(files, API_MAX_IDS),
+        max_workers,
+    )
+    return [page for chunk_results in results for page in chunk_results]
+
 
 def format_commons_metadata_for_file(fields, file_data):
     tmp = {"title": file_data["title"]}
@@ -282,12 +506,70 @@ def format_commons_media_metadata_results(files_data):
     return data
 
 
-def fetch_and_format_commons_media_metadata_results(site, files):
+def configure_commons_media_cache(
+    maxsize=COMMONS_MEDIA_CACHE_SIZE,
+    disk_maxsize=COMMONS_MEDIA_CACHE_DISK_SIZE,
+    ttl=COMMONS_MEDIA_CACHE_TTL,
+    persist=True,
+):
+    """replace the commons media metadata cache. The formatted metadata is kept
+    in memory, and in cache/commons_media.sqlite3 when persist is True. Files
+    are fetched again once their metadata is older than ttl seconds; set ttl to
+    None to never fetch them again."""
+    global commons_media_cache
+    commons_media_cache = create_cache(
+        "commons_media",
+        maxsize=maxsize,
+        disk_maxsize=disk_maxsize,
+        ttl=ttl,
+        persist=persist,
+    )
+    return commons_media_cache
+
+
+def get_commons_media_cache():
+    if commons_media_cache is None:
+        configure_commons_media_cache()
+    return commons_media_cache
+
+
+@metrics.timed
+def fetch_and_format_commons_media_metadata_results(
+    site,
+    files,
+    max_workers=MAX_WORKERS,
+    thumb_width=COMMONS_THUMB_WIDTH,
+    use_cache=True,
+):
     """pywikibot ItemPage only includes the file name for commons media. we
     need to  do a separate api call to get other metadata for the media.
+    Files without metadata, e.g. missing or deleted files, are cached as None
+    and left out of the results.
     """
-    results = fetch_commons_media_metadata(site, files)
-    return format_commons_media_metadata_results(results)
+    if not use_cache:
+        results = fetch_commons_media_metadata(site, files, max_workers, thumb_width)
+        return format_commons_media_metadata_results(results)
+
+    # only send the files that are not in the cache to the api
+    cache = get_commons_media_cache()
+    keys = {file: f"{thumb_width}|{file}" for file in files}
+    cached = cache.get_many(keys.values())
+
+    data = {file: cached[key] for file, key in keys.items() if key in cached}
+    missing = [file for file in keys if file not in data]
+    data = {file: value for file, value in data.items() if value is not None}
+    if len(missing) > 0:
+        results = fetch_and_format_commons_media_metadata_results(
+            site, missing, max_workers, thumb_width, use_cache=False
+        )
+        new_entries = {keys[file]: None for file in missing}
+        new_entries.update(
+            {f"{thumb_width}|{title}": value for title, value in results.items()}
+        )
+        cache.set_many(new_entries)
+        data.update(results)
+
+    return data
 
 
 def fetch_external_id_links(qid):
@@ -324,11 +606,124 @@ def format_external_id_links_results(results):
     return data
 
 
+@metrics.timed
 def fetch_and_format_external_id_links(qid):
     results = fetch_external_id_links(qid)
     return format_external_id_links_results(results)
 
 
+def fetch_external_id_links_for_ids(qids):
+    """get all the urls for external ids for a list of qids"""
+
+    query = """
+    SELECT ?item ?property ?value WHERE {
+      VALUES ?item { %s }
+      ?property wikibase:propertyType wikibase:ExternalId .
+      ?property wikibase:directClaim ?propertyclaim .
+      ?property wdt:P1630 ?formatterURL .
+      ?item ?propertyclaim ?_value .
+      BIND(IRI(REPLACE(?formatterURL, "\\\$1", ?_value)) AS ?value)
+    }
+    """ % " ".join(
+        ["wd:" + qid for qid in qids]
+    )
+
+    return wikidata_query(query)
+
+
+def format_external_id_links_for_ids_results(results):
+    """create {qid: {property id: url}} dictionary"""
+    data = {}
+    for result in results:
+        qid = result["item"]["value"].split("/")[-1]
+        data.setdefault(qid, {})
+        data[qid].update(format_external_id_links_results([result]))
+    return data
+
+
+@metrics.timed
+def fetch_and_format_external_id_links_for_ids(qids):
+    data = {qid: {} for qid in qids}
+    for chunk_qids in chunk_list(qids, API_MAX_IDS):
+        results = fetch_external_id_links_for_ids(chunk_qids)
+        data.update(format_external_id_links_for_ids_results(results))
+    return data
+
+
+def fetch_external_id_formatter_urls():
+    """get the formatter url (P1630) for every external id property"""
+
+    query = """
+    SELECT ?property ?formatterURL WHERE {
+        ?property wikibase:propertyType wikibase:ExternalId .
+        ?property wdt:P1630 ?formatterURL .
+    }
+    """
+
+    return wikidata_query(query)
+
+
+def format_external_id_formatter_urls_results(results):
+    data = {}
+    for result in results:
+        pid = result["property"]["value"].split("/")[-1]
+        # some properties have several formatter urls. use the first one.
+        if pid not in data:
+            data[pid] = result["formatterURL"]["value"]
+
+    return data
+
+
+@metrics.timed
+def fetch_and_format_external_id_formatter_urls():
+    results = fetch_external_id_formatter_urls()
+    return format_external_id_formatter_urls_results(results)
+
+
+def save_external_id_formatter_urls(path=EXTERNAL_ID_FORMATTER_URLS_PATH):
+    """build the {property id: formatter url} index for all external id
+    properties and save it to the constants directory"""
+    data = fetch_and_format_external_id_formatter_urls()
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+    global external_id_formatter_urls
+    external_id_formatter_urls = data
+    return data
+
+
+def load_external_id_formatter_urls(path=EXTERNAL_ID_FORMATTER_URLS_PATH):
+    """get the {property id: formatter url} index. The index is built with one
+    sparql query and saved the first time it is used. Returns an empty
+    dictionary if the index can not be built, so the callers use a sparql
+    query per item until the process is restarted."""
+    global external_id_formatter_urls
+    with external_id_formatter_urls_lock:
+        if external_id_formatter_urls is not None:
+            return external_id_formatter_urls
+
+        if Path(path).exists():
+            with open(path) as f:
+                external_id_formatter_urls = json.load(f)
+            return external_id_formatter_urls
+
+        try:
+            save_external_id_formatter_urls(path)
+            logger.info(f"External id formatter urls saved to {path}")
+        except call_ledger.CallBudgetExceeded:
+            raise
+        except Exception as err:
+            logger.error(f"Could not build the formatter url index: {err}")
+            external_id_formatter_urls = {}
+
+    return external_id_formatter_urls
+
+
+def format_external_id_link(formatter_url, value):
+    """create the url for an external id by replacing $1 in the formatter url"""
+    return formatter_url.replace("$1", value)
+
+
 def fetch_wikidata_languages(site):
     """get all languges for wikidata labels, descriptions, aliases
     https://www.wikidata.org/w/api.php?action=help&modules=query%2Bwbcontentlanguages
@@ -340,26 +735,136 @@ def fetch_wikidata_languages(site):
         "wbclcontext": "term",
         "wbclprop": "code|name",
     }
-    api_request = api.Request(site=site, parameters=params)
-    result = api_request.submit()
+    result = wh.submit_api_request(site, params)
 
     return result["query"]["wbcontentlanguages"]
 
 
-def format_item_languages(results, item_lang_codes):
+def format_wikidata_languages(results):
+    """create {code: name} dictionary for wbcontentlanguages results"""
+    return {lang["code"]: lang["name"] for lang in results.values()}
+
+
+def configure_languages_cache(
+    refresh_interval=LANGUAGES_REFRESH_INTERVAL, persist=True
+):
+    """replace the languages cache. The languages are kept in memory for the
+    whole process, and in cache/languages.sqlite3 when persist is True so a new
+    process does not need to download them again."""
+    global languages_cache
+    languages_cache = create_cache(
+        "languages", maxsize=100, ttl=refresh_interval, persist=persist
+    )
+    return languages_cache
+
+
+def get_languages_cache():
+    if languages_cache is None:
+        configure_languages_cache()
+    return languages_cache
+
+
+@metrics.timed
+def fetch_and_format_wikidata_languages(site, use_cache=True):
+    """get {code: name} for all wikidata content languages. The languages are
+    only downloaded when they are not in the cache or the cache is older than
+    the refresh interval."""
+    if not use_cache:
+        return format_wikidata_languages(fetch_wikidata_languages(site))
+
+    cache = get_languages_cache()
+    key = str(site)
+    languages = cache.get(key)
+    if languages is None:
+        languages = format_wikidata_languages(fetch_wikidata_languages(site))
+        cache.set(key, languages)
+
+    return languages
+
+
+def format_item_languages(languages, item_lang_codes):
+    """get the language names for the language codes using the {code: name}
+    dictionary of all languages"""
     item_langs = {}
 
-    for lang in results.values():
-        if lang["code"] in item_lang_codes:
-            item_langs[lang["code"]] = lang["name"]
+    for code in item_lang_codes:
+        if code in languages:
+            item_langs[code] = languages[code]
 
     return item_langs
 
 
-def fetch_and_format_item_languages(site, item_lang_codes):
+@metrics.timed
+def fetch_and_format_item_languages(site, item_lang_codes, use_cache=True):
     """get the language names for all the language codes in an item"""
-    results = fetch_wikidata_languages(site)
-    return format_item_languages(results, item_lang_codes)
+    languages = fetch_and_format_wikidata_languages(site, use_cache)
+    return format_item_languages(languages, item_lang_codes)
+
+
+def fetch_entities(site, ids, props=None):
+    """get the json for up to 50 entities with wbgetentities
+
+    https://www.wikidata.org/w/api.php?action=help&modules=wbgetentities
+    """
+    params = {
+        "action": "wbgetentities",
+        "format": "json",
+        "ids": "|".join(ids),
+    }
+    if props:
+        params["props"] = props
+    results = wh.submit_api_request(site, params)
+
+    return results["entities"]
+
+
+@metrics.timed
+def fetch_and_format_entities(site, ids, props=None, max_workers=MAX_WORKERS):
+    """get {id: entity json} for a list of ids. Missing entities are skipped.
+    The ids are split into chunks of 50, and up to max_workers chunks are
+    requested at the same time."""
+    results = map_concurrently(
+        lambda chunk_ids: fetch_entities(site, chunk_ids, props),
+        chunk_list(ids, API_MAX_IDS),
+        max_workers,
+    )
+
+    data = {}
+    for chunk_results in results:
+        for id, entity in chunk_results.items():
+            if "missing" not in entity:
+                data[id] = entity
+    return data
+
+
+@metrics.timed
+def fetch_and_format_lastrevids(site, ids, max_workers=MAX_WORKERS):
+    """get {id: lastrevid} for a list of entity ids. Only requests the page info,
+    so it is much cheaper than loading the entities."""
+    entities = fetch_and_format_entities(site, ids, "info", max_workers)
+    return {id: entity["lastrevid"] for id, entity in entities.items()}
+
+
+def get_redirects(entities):
+    """get {redirected id: target id} for the entities from wbgetentities.
+    Redirected ids, e.g. of items that were merged, are returned as the target
+    entity."""
+    return {
+        entity["redirects"]["from"]: entity["redirects"]["to"]
+        for entity in entities.values()
+        if "redirects" in entity
+    }
+
+
+@metrics.timed
+def fetch_and_format_lexeme_lemmas(site, ids, max_workers=MAX_WORKERS):
+    """get {lexeme id: {lang: lemma}} for a list of lexeme ids"""
+    entities = fetch_and_format_entities(site, ids, max_workers=max_workers)
+
+    return {
+        id: {lang: lemma["value"] for lang, lemma in entity["lemmas"].items()}
+        for id, entity in entities.items()
+    }
 
 
 def fetch_all_props_for_ids(ids):
@@ -390,6 +895,7 @@ def format_menu_options(results):
     return data
 
 
+@metrics.timed
 def fetch_and_format_menu_options(ids):
     results = fetch_all_props_for_ids(ids)
     return format_menu_options(results)
@@ -1,5 +1,7 @@
 import re
 
+import pywikibot
+
 from scripts.utils.logger import logger
 
 
@@ -248,3 +250,25 @@ def format_item_aliases(item_json):
             data[lang].append(value["value"])
 
     return data
+
+
+def freeze_value(value):
+    """convert dictionaries and lists to tuples so that a value can be used as
+    a dictionary key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze_value(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_value(v) for v in value)
+    return value
+
+
+def normalize_claim_value(value):
+    """create a hashable value for a claim target. Targets that are equal in
+    pywikibot have the same normalized value."""
+    if isinstance(value, pywikibot.page.WikibaseEntity):
+        return value.getID()
+    if isinstance(value, pywikibot.Page):
+        return value.title()
+    if hasattr(value, "toWikibase"):
+        return freeze_value(value.toWikibase())
+    return freeze_value(value)
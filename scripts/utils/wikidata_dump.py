@@ -0,0 +1,116 @@
+import bz2
+import gzip
+import json
+from pathlib import Path
+import re
+
+import pywikibot
+
+from scripts.utils.logger import logger
+
+# wikidata json dumps are one array with one entity per line:
+# [
+# {"type":"item","id":"Q1",...},
+# {"type":"item","id":"Q2",...}
+# ]
+# https://www.wikidata.org/wiki/Wikidata:Database_download#JSON_dumps_(recommended)
+DUMP_OPENERS = {".gz": gzip.open, ".bz2": bz2.open}
+# the entity id is the first id in a line, so lines can be skipped without
+# parsing the json
+ID_PATTERN = re.compile(r'"id"\s*:\s*"([^"]+)"')
+
+
+def open_dump(path, mode="rt"):
+    """open a gzip, bz2 or uncompressed dump as text"""
+    opener = DUMP_OPENERS.get(Path(path).suffix, open)
+    return opener(path, mode, encoding="utf-8")
+
+
+def get_line_id(line):
+    match = ID_PATTERN.search(line)
+    return match.group(1) if match else None
+
+
+def parse_dump_line(line):
+    """get the entity json for a dump line, or None for the lines with the
+    brackets of the array"""
+    line = line.strip().rstrip(",")
+    if line in ["", "[", "]"]:
+        return
+    return json.loads(line)
+
+
+def get_instance_of(entity):
+    """get the qids of the P31 (instance of) values of an entity"""
+    return {
+        claim["mainsnak"]["datavalue"]["value"]["id"]
+        for claim in entity.get("claims", {}).get("P31", [])
+        if claim["mainsnak"]["snaktype"] == "value"
+    }
+
+
+def line_may_match(line, qids=None, properties=None, classes=None):
+    """check a dump line before parsing it. Lines that return False can not
+    match the filters; lines that return True still need entity_matches."""
+    if qids is not None and get_line_id(line) not in qids:
+        return False
+    if properties is not None and not any(
+        f'"{property}":' in line for property in properties
+    ):
+        return False
+    if classes is not None and '"P31":' not in line:
+        return False
+    return True
+
+
+def entity_matches(entity, qids=None, properties=None, classes=None):
+    """check if an entity is one of the qids, has a claim for one of the
+    properties and is an instance of one of the classes. Filters that are None
+    are not checked."""
+    if qids is not None and entity["id"] not in qids:
+        return False
+    if properties is not None:
+        claims = entity.get("claims", {})
+        if not any(property in claims for property in properties):
+            return False
+    if classes is not None and not get_instance_of(entity) & set(classes):
+        return False
+    return True
+
+
+def read_dump(path, qids=None, properties=None):
+    """generator of the entity json in a dump, filtered by a set of qids and a
+    list of properties. The dump is read one line at a time, so memory does not
+    grow with the size of the dump. Stops when every qid has been found."""
+    remaining = set(qids) if qids is not None else None
+    with open_dump(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if remaining is not None and not remaining:
+                break
+            if not line_may_match(line, remaining, properties):
+                continue
+
+            try:
+                entity = parse_dump_line(line)
+            except json.JSONDecodeError as err:
+                logger.error(f"Invalid dump line {line_number} skipped: {err}")
+                continue
+            if entity is None or not entity_matches(entity, remaining, properties):
+                continue
+
+            if remaining is not None:
+                remaining.discard(entity["id"])
+            yield entity
+
+    if remaining:
+        logger.warning(f"{len(remaining)} items not found in {path}")
+
+
+def create_item_from_entity(repo, entity):
+    """create a wikidata.org ItemPage from the entity json in a dump without
+    loading it from the api. item.get() returns the same item_dict as an item
+    that is loaded from the api."""
+    item = pywikibot.ItemPage(repo, entity["id"])
+    item._content = entity
+    item.get()
+    return item
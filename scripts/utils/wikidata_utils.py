@@ -1,18 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 import sys
 from pathlib import Path
 import pywikibot
+import threading
 import time
 import re
 
+from scripts.utils.cache import create_cache
+import scripts.utils.call_ledger as call_ledger
+import scripts.utils.id_mapping as id_mapping
 from scripts.utils.logger import logger
+import scripts.utils.metrics as metrics
 from scripts.constants.languages import invalid_languages, allowed_languages_short
 import scripts.utils.wiki_queries as wq
 import scripts.utils.wiki_serialization as ws
+import scripts.utils.wiki_json_serialization as wjs
 
 constants_path = Path(__file__).resolve().parent.parent / "constants"
 sys.path.append(str(constants_path))
 
+# seconds to wait for each remote lookup when format_display_item runs the
+# lookups concurrently
+DISPLAY_FETCH_TIMEOUT = 60
+
+# formatted items also depend on labels and media metadata that can change
+# without a new item revision, so cached items are formatted again after a day
+DISPLAY_ITEM_CACHE_SIZE = 1000
+DISPLAY_ITEM_CACHE_DISK_SIZE = 100000
+DISPLAY_ITEM_CACHE_TTL = 24 * 60 * 60
+
+display_item_cache = None
+# background threads that check if cached items have changed
+display_item_refresh_executor = ThreadPoolExecutor(max_workers=2)
+display_item_refreshes = set()
+display_item_refreshes_lock = threading.Lock()
+
 
 def validate_create_data(data, key):
     if key not in data:
@@ -29,6 +52,7 @@ def validate_create_data(data, key):
             raise ValueError(f"create_item: {key} must be a dictionary")
 
 
+@metrics.timed
 def create_item(site, data, validation=True):
     """create wikidata item (Q id record)."""
     if validation:
@@ -103,6 +127,8 @@ def edit_entity(item, data):
                     return pywikibot.ItemPage(repo, qid)
 
             logger.error(f"Could not edit item *: {err}")
+    except call_ledger.CallBudgetExceeded:
+        raise
     except:
         if "en" in data["labels"]:
             lang = "en"
@@ -145,6 +171,8 @@ def add_claim(repo, item, property, value):
         item.addClaim(new_claim, summary="Add claim.")
         logger.info(f"Add claim: {item.id} {property} {value}")
         return new_claim
+    except call_ledger.CallBudgetExceeded:
+        raise
     except:
         logger.error(f"Could not add claim: {item.id} {property} {value}")
 
@@ -188,6 +216,8 @@ def remove_qualifier(item, statement_property, qualifier_property):
             try:
                 claim.removeQualifier(qualifier, summary="Remove qualifier.")
                 logger.info(f"Remove qualifier: {item.id} {qualifier_property}")
+            except call_ledger.CallBudgetExceeded:
+                raise
             except:
                 logger.error(
                     f"Could not delete qualifier {item.id} {qualifier_property}"
@@ -207,6 +237,8 @@ def add_reference(repo, claim, property, value):
     try:
         claim.addSources([new_source], summary="Adding sources.")
         logger.info(f"Add source: {claim.id} {property} {value}")
+    except call_ledger.CallBudgetExceeded:
+        raise
     except:
         logger.error(f"add_reference error: {claim.id} {property} {value}")
 
@@ -241,8 +273,16 @@ def remove_reference(item, statement_property, reference_property):
             logger.info(f"Remove sources: {claim.id} {reference_property}")
 
 
+@metrics.timed
 def import_item(site, item_dict, import_sitelinks=True, limit_languages=False):
     """import an item record from wikidata."""
+    data = format_import_data(item_dict, import_sitelinks, limit_languages)
+    return create_item(site, data, validation=False)
+
+
+def format_import_data(item_dict, import_sitelinks=True, limit_languages=False):
+    """create the labels, descriptions, aliases and sitelinks data to import
+    an item record from wikidata."""
     ws.remove_identical_label_description(item_dict)
     data = {}
     for key, values in item_dict.items():
@@ -264,7 +304,7 @@ def import_item(site, item_dict, import_sitelinks=True, limit_languages=False):
         else:
             print(f"{key} not imported")
 
-    return create_item(site, data, validation=False)
+    return data
 
 
 def get_claim_language(claim_dict):
@@ -276,12 +316,21 @@ def get_claim_language(claim_dict):
     return lang
 
 
-def convert_to_local_claim_value(site, repo, claim, import_sitelinks):
+@metrics.timed
+def convert_to_local_claim_value(
+    site, repo, claim, import_sitelinks, entity_cache=None
+):
     """When importing claims from wikidata.org, they often refer to items records
     (Q id) that exists in wikidata.org. This method searches if the item record
     exists in the local wikidata. If record exists, return the record
     from local wikidata. If record does not exists, create record in local
-    wikidata, and return new record."""
+    wikidata, and return new record. Items that were already imported or
+    matched are looked up in the id mapping store instead of searching.
+
+    entity_cache is an optional {qid: item_dict} dictionary of wikidata.org
+    items that were loaded by prefetch_entities. Items in the cache are not
+    requested again."""
+    entity_cache = entity_cache or {}
 
     claim_value = claim.target
     if not claim_value:
@@ -293,30 +342,50 @@ def convert_to_local_claim_value(site, repo, claim, import_sitelinks):
         )
 
     elif claim.type == "quantity":
-        if not claim_value.get_unit_item():
+        # unit is "1" or the url for wikidata item record. The qid is taken
+        # from the url, since get_unit_item() requests the unit item.
+        if claim_value.unit == "1":
             return claim_value
+        unit_qid = claim_value.unit.rsplit("/", 1)[-1]
 
-        unit_dict = claim_value.get_unit_item().get()
-        lang = get_claim_language(unit_dict)
+        # check if unit was already imported or matched
+        local_id = id_mapping.get_local_id(repo, unit_qid)
+        if local_id:
+            new_unit_value = pywikibot.ItemPage(repo, local_id)
+        else:
+            if unit_qid in entity_cache:
+                unit_dict = entity_cache[unit_qid]
+            else:
+                unit_dict = claim_value.get_unit_item().get()
+            lang = get_claim_language(unit_dict)
 
-        # check if unit exists locally
-        results = wq.search_keyword(site, unit_dict["labels"][lang])
-        existing = False
-        for result in results:
-            if (
-                result["description"] == unit_dict["descriptions"][lang]
-                and result["label"] == unit_dict["labels"][lang]
-            ):
-                existing = True
-                new_unit_value = pywikibot.ItemPage(repo, result["id"])
-        # if unit doesn't exists locally, import it
-        if not existing:
-            new_unit_value = import_item(site, unit_dict, import_sitelinks)
+            # check if unit exists locally
+            results = wq.search_keyword(site, unit_dict["labels"][lang])
+            existing = False
+            for result in results:
+                if (
+                    result["description"] == unit_dict["descriptions"][lang]
+                    and result["label"] == unit_dict["labels"][lang]
+                ):
+                    existing = True
+                    new_unit_value = pywikibot.ItemPage(repo, result["id"])
+            # if unit doesn't exists locally, import it
+            if not existing:
+                new_unit_value = import_item(site, unit_dict, import_sitelinks)
+            id_mapping.set_local_id(repo, unit_qid, new_unit_value.id)
         unit = new_unit_value.full_url().replace("wiki/Item%3A", "entity/")
         return pywikibot.WbQuantity(amount=claim_value.amount, unit=unit, site=site)
 
     elif claim.type == "wikibase-item":
-        claim_item_dict = claim_value.get()
+        # check if claim item was already imported or matched
+        local_id = id_mapping.get_local_id(repo, claim_value.id)
+        if local_id:
+            return pywikibot.ItemPage(repo, local_id)
+
+        if claim_value.id in entity_cache:
+            claim_item_dict = entity_cache[claim_value.id]
+        else:
+            claim_item_dict = claim_value.get()
         lang = get_claim_language(claim_item_dict)
 
         # check if claim item exists locally
@@ -338,6 +407,8 @@ def convert_to_local_claim_value(site, repo, claim, import_sitelinks):
         # if claim item doesn't exists locally, import it
         if not existing:
             new_claim_value = import_item(site, claim_item_dict, import_sitelinks)
+        if new_claim_value:
+            id_mapping.set_local_id(repo, claim_value.id, new_claim_value.id)
         return new_claim_value
 
     elif claim.type == "commonsMedia":
@@ -421,13 +492,47 @@ def get_commons_media_for_item(item):
     return list(media)
 
 
-def create_id_label_dictionary(item, item_json):
-    """create dictionary with ids (item Q id and property P id) and their labels"""
+def get_best_rank_claims(claims):
+    """get the claims with the best rank. Same as the claims that the
+    wikidata query service returns for wdt: direct claims."""
+    preferred = [claim for claim in claims if claim.rank == "preferred"]
+    if preferred:
+        return preferred
+    return [claim for claim in claims if claim.rank == "normal"]
+
+
+def get_external_id_links_for_item(item, formatter_urls=None):
+    """create {property id: url} dictionary for the external ids in an item.
+    Uses the formatter url index so the urls are created without calling
+    wikidata. Falls back to a sparql query if the index has not been built."""
+    if formatter_urls is None:
+        formatter_urls = wq.load_external_id_formatter_urls()
+    if not formatter_urls:
+        return wq.fetch_and_format_external_id_links(item.id)
+
+    links = {}
+    for prop, claims in item.claims.items():
+        if prop not in formatter_urls:
+            continue
+
+        for claim in get_best_rank_claims(claims):
+            if claim.type == "external-id" and claim.target:
+                links[prop] = wq.format_external_id_link(
+                    formatter_urls[prop], claim.target
+                )
+                break
+
+    return links
+
+
+def create_id_label_dictionary(item, item_json, use_cache=True):
+    """create dictionary with ids (item Q id and property P id) and their labels.
+    Imports use use_cache=False, since claims are matched by label."""
     ids = get_ids_for_item(item, item_json, include_pids=True, include_qids=True)
 
     # connect to wikidata.org API to get labels for a list of ids
     if len(ids) > 0:
-        return wq.fetch_and_format_labels_for_ids_sqarql(ids)
+        return wq.fetch_and_format_labels_for_ids_sqarql(ids, use_cache=use_cache)
     else:
         return {}
 
@@ -446,64 +551,450 @@ def get_all_language_codes_for_item(item):
     return item_lang_codes
 
 
-def format_display_item(item, site):
-    """takes the json from a item and reshapes it to fit the needs of the
-    of our /items/{id} API endpoint
-    """
-    data = {}
-    item_json = item.toJSON()
+def get_display_item_fetches(item, item_json, site):
+    """get the remote lookups needed to display an item. None of the lookups
+    depends on another one, so they can be run in any order."""
+    media_files = get_commons_media_for_item(item)
+    item_lang_codes = get_all_language_codes_for_item(item)
 
-    s1 = time.time()
-    # reshape json to create {language: value} dictionary
+    return {
+        # create {item_id: label, property_id: label} dictionary so we can
+        # include labels in api response
+        "id_label_dict": (create_id_label_dictionary, (item, item_json)),
+        # get metadata for every commons media that is associated with this
+        # item so we can add media metadata to api response
+        "media_metadata": (
+            wq.fetch_and_format_commons_media_metadata_results,
+            (site, media_files),
+        ),
+        # get links for external ids in this item so we can add links for
+        # external id to api response
+        "external_id_links": (get_external_id_links_for_item, (item,)),
+        # get all the language names for the all the language codes in an item
+        "languages": (wq.fetch_and_format_item_languages, (site, item_lang_codes)),
+    }
+
+
+def get_fetch_timeout(timeout, name):
+    """timeout can be a number of seconds for every lookup, or a dictionary
+    with the number of seconds for each lookup"""
+    if isinstance(timeout, dict):
+        return timeout.get(name, DISPLAY_FETCH_TIMEOUT)
+    return timeout
+
+
+def run_display_item_fetch(name, func, args):
+    """run a remote lookup in a metrics span with the lookup name"""
+    with metrics.span(name):
+        return func(*args)
+
+
+def run_display_item_fetches(fetches, concurrent=False, timeout=DISPLAY_FETCH_TIMEOUT):
+    """run the remote lookups for an item one after another, or in a thread pool
+    when concurrent is True. Raises concurrent.futures.TimeoutError if a lookup
+    does not finish within its timeout. Each lookup is timed in a metrics span
+    with the lookup name."""
+    results = {}
+
+    if not concurrent:
+        for name, (func, args) in fetches.items():
+            results[name] = run_display_item_fetch(name, func, args)
+        return results
+
+    start = time.time()
+    executor = ThreadPoolExecutor(max_workers=len(fetches))
+    try:
+        futures = {
+            name: metrics.run_in_context(
+                executor, run_display_item_fetch, name, func, args
+            )
+            for name, (func, args) in fetches.items()
+        }
+        for name, future in futures.items():
+            # every lookup started at the same time, so only wait for the time
+            # that is left for this lookup
+            fetch_timeout = get_fetch_timeout(timeout, name)
+            if fetch_timeout is not None:
+                fetch_timeout = max(fetch_timeout - (time.time() - start), 0)
+            results[name] = future.result(timeout=fetch_timeout)
+    finally:
+        # don't block on lookups that timed out
+        executor.shutdown(wait=False)
+
+    return results
+
+
+def format_display_item_fields(item_json):
+    """reshape json to create {language: value} dictionary for labels,
+    descriptions and aliases"""
+    data = {}
     for field in ["labels", "descriptions", "aliases"]:
         if field in item_json:
             if field == "aliases":
                 data[field] = ws.format_item_aliases(item_json)
             else:
                 data[field] = ws.format_item_field(item_json, field)
+    return data
 
-    s2 = time.time()
-    print("basic", s2 - s1)
 
-    # create {item_id: label, property_id: label} dictionary so we can
-    # include labels in api response
-    id_label_dict = create_id_label_dictionary(item, item_json)
+def serialize_display_item(
+    item, item_json, id_label_dict, media_metadata, external_id_links, languages
+):
+    """create the /items/{id} API response for an item using the results of
+    the remote lookups"""
+    data = format_display_item_fields(item_json)
 
-    s3 = time.time()
-    print("create_id_label_dictionary", s3 - s2)
+    tmp = ws.format_item_claims(item, id_label_dict, media_metadata, external_id_links)
+    data["statements"] = tmp["statements"]
+    data["identifiers"] = tmp["identifiers"]
+    data["languages"] = languages
+    data["id"] = item.id
 
-    # get metadata for every commons media that is associated with this item
-    # so we can add media metadata to api response
-    media_files = get_commons_media_for_item(item)
-    media_metadata = wq.fetch_and_format_commons_media_metadata_results(
-        site, media_files
-    )
+    return data
 
-    s4 = time.time()
-    print("media_files", s4 - s3)
 
-    # get links for external ids in this item so we can add links for
-    # external id to api response
-    external_id_links = wq.fetch_and_format_external_id_links(item.id)
+def format_display_item(
+    item,
+    site,
+    concurrent=False,
+    timeout=DISPLAY_FETCH_TIMEOUT,
+    budget=None,
+    on_budget_exceeded="raise",
+    include_api_calls=False,
+):
+    """takes the json from a item and reshapes it to fit the needs of the
+    of our /items/{id} API endpoint
 
-    s5 = time.time()
-    print("external_id_links", s5 - s4)
+    When concurrent is True, the label, commons media, external id and language
+    lookups are run in parallel. timeout is the number of seconds to wait for
+    each lookup, or a dictionary of seconds keyed by lookup name
+    (id_label_dict, media_metadata, external_id_links, languages).
 
-    tmp = ws.format_item_claims(item, id_label_dict, media_metadata, external_id_links)
+    Each lookup and the claims formatting are timed in metrics spans.
+
+    budget is the maximum number of requests. When it is exceeded,
+    CallBudgetExceeded is raised, or a warning is logged when
+    on_budget_exceeded is "warn". include_api_calls adds the request counts
+    to the result as "api_calls".
+    """
+    with call_ledger.call_ledger(
+        "format_display_item", budget, on_budget_exceeded
+    ) as ledger, metrics.span("format_display_item"):
+        item_json = item.toJSON()
+
+        fetches = get_display_item_fetches(item, item_json, site)
+        results = run_display_item_fetches(fetches, concurrent, timeout)
+
+        with metrics.span("format_item_claims"):
+            data = serialize_display_item(
+                item,
+                item_json,
+                results["id_label_dict"],
+                results["media_metadata"],
+                results["external_id_links"],
+                results["languages"],
+            )
+
+    if include_api_calls:
+        data["api_calls"] = ledger.totals()
+
+    return data
+
+
+def get_display_item_json_fetches(item_json, site, lang="en"):
+    """get the remote lookups needed to display an item from the wbgetentities
+    json. Same lookups as get_display_item_fetches; labels are in lang."""
+    repo = site.data_repository()
+    ids = wjs.get_ids_for_item(item_json, include_pids=True, include_qids=True)
+    media_files = wjs.get_commons_media_for_item(item_json)
+    lexeme_ids = wjs.get_lexeme_ids_for_item(item_json)
+    item_lang_codes = wjs.get_all_language_codes_for_item(item_json)
+
+    return {
+        "id_label_dict": (wq.fetch_and_format_labels_for_ids_sqarql, (ids, lang)),
+        "media_metadata": (
+            wq.fetch_and_format_commons_media_metadata_results,
+            (site, media_files),
+        ),
+        "external_id_links": (get_external_id_links_for_item_json, (item_json,)),
+        "languages": (wq.fetch_and_format_item_languages, (site, item_lang_codes)),
+        "lexemes": (wq.fetch_and_format_lexeme_lemmas, (repo, lexeme_ids)),
+    }
+
+
+def get_external_id_links_for_item_json(item_json, formatter_urls=None):
+    """create {property id: url} dictionary for the external ids in the
+    wbgetentities json for an item. Same as get_external_id_links_for_item."""
+    if formatter_urls is None:
+        formatter_urls = wq.load_external_id_formatter_urls()
+    if not formatter_urls:
+        return wq.fetch_and_format_external_id_links(item_json["id"])
+
+    links = {}
+    for prop, claims in item_json.get("claims", {}).items():
+        if prop not in formatter_urls:
+            continue
+
+        preferred = [claim for claim in claims if claim["rank"] == "preferred"]
+        best_claims = preferred or [c for c in claims if c["rank"] == "normal"]
+        for claim in best_claims:
+            value = wjs.get_snak_value(claim["mainsnak"])
+            if wjs.get_snak_type(claim["mainsnak"]) == "external-id" and value:
+                links[prop] = wq.format_external_id_link(formatter_urls[prop], value)
+                break
+
+    return links
+
+
+def format_display_item_json(
+    item_json,
+    site,
+    concurrent=False,
+    timeout=DISPLAY_FETCH_TIMEOUT,
+    lang="en",
+    budget=None,
+    on_budget_exceeded="raise",
+    include_api_calls=False,
+):
+    """same as format_display_item, but uses the wbgetentities json for an
+    item instead of a pywikibot ItemPage. This avoids creating pywikibot
+    objects for every claim, which is slow for large items."""
+    with call_ledger.call_ledger(
+        "format_display_item_json", budget, on_budget_exceeded
+    ) as ledger, metrics.span("format_display_item_json"):
+        fetches = get_display_item_json_fetches(item_json, site, lang)
+        results = run_display_item_fetches(fetches, concurrent, timeout)
+
+        data = wjs.format_item_fields(item_json)
+
+        with metrics.span("format_item_claims"):
+            tmp = wjs.format_item_claims(
+                item_json,
+                results["id_label_dict"],
+                results["media_metadata"],
+                results["external_id_links"],
+                site.data_repository(),
+                results["lexemes"],
+            )
     data["statements"] = tmp["statements"]
     data["identifiers"] = tmp["identifiers"]
+    data["languages"] = results["languages"]
+    data["id"] = item_json["id"]
 
-    s6 = time.time()
-    print("claims", s6 - s5)
+    if include_api_calls:
+        data["api_calls"] = ledger.totals()
 
-    # get all the language names for the all the language codes in an item
-    item_lang_codes = get_all_language_codes_for_item(item)
-    langs_dict = wq.fetch_and_format_item_languages(site, item_lang_codes)
-    data["languages"] = langs_dict
-    data["id"] = item.id
+    return data
+
+
+def fetch_item_json(site, qid):
+    """get the wbgetentities json for an item"""
+    entities = wq.fetch_entities(site.data_repository(), [qid])
+    # redirected items are returned with the id of the redirect target
+    item_json = next(iter(entities.values()))
+    if "missing" in item_json:
+        raise ValueError(f"{qid} does not exist")
+
+    return item_json
+
+
+def fetch_and_format_display_item(qid, site, concurrent=False, lang="en"):
+    """get an item from wikidata and format it for our /items/{id} API endpoint
+    without creating pywikibot objects"""
+    item_json = fetch_item_json(site, qid)
+    return format_display_item_json(item_json, site, concurrent, lang=lang)
+
+
+def configure_display_item_cache(
+    maxsize=DISPLAY_ITEM_CACHE_SIZE,
+    disk_maxsize=DISPLAY_ITEM_CACHE_DISK_SIZE,
+    ttl=DISPLAY_ITEM_CACHE_TTL,
+    persist=True,
+):
+    """replace the cache of formatted display items. The items are kept in
+    memory, and in cache/display_items.sqlite3 when persist is True."""
+    global display_item_cache
+    display_item_cache = create_cache(
+        "display_items",
+        maxsize=maxsize,
+        disk_maxsize=disk_maxsize,
+        ttl=ttl,
+        persist=persist,
+    )
+    return display_item_cache
 
-    s7 = time.time()
-    print("end", s7 - s6)
+
+def get_display_item_cache():
+    if display_item_cache is None:
+        configure_display_item_cache()
+    return display_item_cache
+
+
+def refresh_display_item(qid, site, lang="en", concurrent=False):
+    """format an item and save it in the display item cache"""
+    item_json = fetch_item_json(site, qid)
+    data = format_display_item_json(item_json, site, concurrent, lang=lang)
+
+    get_display_item_cache().set(
+        f"{qid}|{lang}", {"lastrevid": item_json["lastrevid"], "data": data}
+    )
+    return data
+
+
+def revalidate_display_item(qid, site, lang, lastrevid):
+    """format an item again if it changed since it was cached"""
+    key = f"{qid}|{lang}"
+    try:
+        revisions = wq.fetch_and_format_lastrevids(site.data_repository(), [qid])
+        if revisions.get(qid) != lastrevid:
+            refresh_display_item(qid, site, lang)
+    except Exception as err:
+        logger.error(f"Could not refresh display item {qid}: {err}")
+    finally:
+        with display_item_refreshes_lock:
+            display_item_refreshes.discard(key)
+
+
+def get_display_item(
+    qid, site, lang="en", stale_while_revalidate=False, concurrent=False
+):
+    """get an item formatted for our /items/{id} API endpoint. Formatted items
+    are cached by (qid, lastrevid, lang), and a cached item is only used when
+    the item's lastrevid has not changed.
+
+    When stale_while_revalidate is True, a cached item is returned right away
+    and the lastrevid is checked in a background thread that updates the cache
+    if the item has changed.
+    """
+    key = f"{qid}|{lang}"
+    cached = get_display_item_cache().get(key)
+
+    if cached is not None and stale_while_revalidate:
+        with display_item_refreshes_lock:
+            if key not in display_item_refreshes:
+                display_item_refreshes.add(key)
+                display_item_refresh_executor.submit(
+                    revalidate_display_item, qid, site, lang, cached["lastrevid"]
+                )
+        return cached["data"]
+
+    if cached is not None:
+        revisions = wq.fetch_and_format_lastrevids(site.data_repository(), [qid])
+        if revisions.get(qid) == cached["lastrevid"]:
+            return cached["data"]
+
+    return refresh_display_item(qid, site, lang, concurrent)
+
+
+def load_items(site, qids, max_workers=wq.MAX_WORKERS):
+    """load items from wikidata with one wbgetentities request for every 50
+    items. Returns the items in the same order as qids; missing items are
+    skipped."""
+    repo = site.data_repository()
+    pages = [pywikibot.ItemPage(repo, qid) for qid in qids]
+
+    results = wq.map_concurrently(
+        lambda chunk_pages: list(repo.preload_entities(chunk_pages)),
+        wq.chunk_list(pages, wq.API_MAX_IDS),
+        max_workers,
+    )
+    items = {item.id: item for chunk_items in results for item in chunk_items}
+
+    return [items[page.id] for page in pages if page.id in items]
+
+
+@metrics.timed
+def prefetch_entities(
+    site, local_repo, items, max_workers=wq.MAX_WORKERS, entity_cache=None
+):
+    """load every item that is used in the claims, qualifiers and references of
+    a list of items, e.g. item values and quantity units. Items are loaded with
+    one wbgetentities request for every 50 items instead of one request per
+    claim, and items used by several items are only loaded once. Items that are
+    already in the id mapping store for local_repo are skipped. Returns
+    {qid: item_dict} that can be passed to convert_to_local_claim_value as
+    entity_cache.
+
+    entity_cache is an optional {qid: item_dict} of items that were already
+    loaded. They are not loaded again and are added to the result."""
+    entity_cache = entity_cache or {}
+    qids = set()
+    for item in items:
+        qids.update(
+            get_ids_for_item(item, item.toJSON(), include_pids=False, include_qids=True)
+        )
+    mapped = id_mapping.get_mapping_store().get_many(local_repo, qids)
+    qids = [qid for qid in qids if qid not in mapped and qid not in entity_cache]
+
+    # preload_entities already loaded the items, so get() doesn't make requests
+    loaded = {entity.id: entity.get() for entity in load_items(site, qids, max_workers)}
+    return {**entity_cache, **loaded}
+
+
+def get_external_id_links_for_items(items):
+    """create {qid: {property id: url}} dictionary for the external ids in a
+    list of items. Uses one sparql query for every 50 items if the formatter
+    url index has not been built."""
+    formatter_urls = wq.load_external_id_formatter_urls()
+    if not formatter_urls:
+        return wq.fetch_and_format_external_id_links_for_ids([i.id for i in items])
+
+    return {
+        item.id: get_external_id_links_for_item(item, formatter_urls) for item in items
+    }
+
+
+@metrics.timed
+def format_display_items(
+    qids, site, concurrent=False, timeout=DISPLAY_FETCH_TIMEOUT, max_workers=None
+):
+    """format many items for our /items/{id} API endpoint. The items are
+    loaded in batches, and the ids, media and languages for all the items are
+    looked up together instead of once per item."""
+    if max_workers is None:
+        max_workers = wq.MAX_WORKERS
+
+    items = load_items(site, qids, max_workers)
+    items_json = {item.id: item.toJSON() for item in items}
+
+    ids = set()
+    media_files = set()
+    items_lang_codes = {}
+    for item in items:
+        ids.update(
+            get_ids_for_item(
+                item, items_json[item.id], include_pids=True, include_qids=True
+            )
+        )
+        media_files.update(get_commons_media_for_item(item))
+        items_lang_codes[item.id] = get_all_language_codes_for_item(item)
+
+    all_lang_codes = set().union(*items_lang_codes.values())
+    fetches = {
+        "id_label_dict": (wq.fetch_and_format_labels_for_ids_sqarql, (list(ids),)),
+        "media_metadata": (
+            wq.fetch_and_format_commons_media_metadata_results,
+            (site, list(media_files), max_workers),
+        ),
+        "external_id_links": (get_external_id_links_for_items, (items,)),
+        "languages": (wq.fetch_and_format_item_languages, (site, all_lang_codes)),
+    }
+    results = run_display_item_fetches(fetches, concurrent, timeout)
+
+    data = []
+    for item in items:
+        data.append(
+            serialize_display_item(
+                item,
+                items_json[item.id],
+                results["id_label_dict"],
+                results["media_metadata"],
+                results["external_id_links"].get(item.id, {}),
+                wq.format_item_languages(
+                    results["languages"], items_lang_codes[item.id]
+                ),
+            )
+        )
 
     return data
 
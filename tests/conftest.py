@@ -0,0 +1,15 @@
+import os
+import sys
+from pathlib import Path
+import tempfile
+
+# the logger, the id mapping store and pywikibot write to the base directory,
+# so the tests use a temporary one and don't need a user-config.py
+base_dir = tempfile.mkdtemp()
+os.environ.setdefault("APP_ENV", "testing")
+os.environ.setdefault("BASE_DIR", base_dir)
+os.environ.setdefault("PYWIKIBOT_DIR", base_dir)
+os.environ.setdefault("PYWIKIBOT_NO_USER_CONFIG", "1")
+
+parent_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_path))
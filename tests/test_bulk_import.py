@@ -0,0 +1,128 @@
+import pytest
+
+import scripts.utils.bulk_import as bulk_import
+import scripts.utils.id_mapping as id_mapping
+import scripts.utils.import_wikidata_records as iwr
+import scripts.utils.wikidata_utils as wd
+
+ITEM_DICT = {"labels": {"en": "Douglas Adams"}, "descriptions": {}, "claims": {}}
+
+
+class FakeItemPage:
+    def __init__(self, repo, id="-1"):
+        self.repo = repo
+        self.id = id
+        self.latest_revision_id = 100
+
+    def get(self):
+        return ITEM_DICT
+
+    def toJSON(self):
+        return {}
+
+
+class FakeSite:
+    def data_repository(self):
+        return "repo"
+
+
+@pytest.fixture(params=["new", "existing"])
+def offline_import(request, monkeypatch, tmp_path):
+    """run bulk_import in entity write mode without a wiki, for a new local item
+    and for an existing one. Returns the list of loaded batches and the list of
+    edit results, where False is a failed edit and True is a saved one."""
+    store = id_mapping.MappingStore(tmp_path / "id_mapping.sqlite3")
+    monkeypatch.setattr(id_mapping, "mapping_store", store)
+    monkeypatch.setattr(iwr.pywikibot, "ItemPage", FakeItemPage)
+
+    def find_local_item(*args):
+        if request.param == "existing":
+            return FakeItemPage("repo", "Q1000")
+
+    monkeypatch.setattr(iwr, "find_local_item", find_local_item)
+    monkeypatch.setattr(iwr, "build_local_entity_data", lambda *args: ITEM_DICT)
+
+    batches = []
+    results = []
+
+    def read_batch(site, local_repo, qids, *args):
+        batches.append(qids)
+        return {qid: FakeItemPage(site, qid) for qid in qids}, {}
+
+    def edit_entity(item, data):
+        if not results.pop(0):
+            return
+        item.id = "Q1000"
+        return item
+
+    monkeypatch.setattr(bulk_import, "read_batch", read_batch)
+    monkeypatch.setattr(wd, "edit_entity", edit_entity)
+    return batches, results
+
+
+def test_failed_edit_is_journaled_and_retried(offline_import, tmp_path):
+    batches, results = offline_import
+    journal_path = tmp_path / "journal.jsonl"
+    site = FakeSite()
+
+    results.append(False)
+    summary = bulk_import.bulk_import(["Q42"], site, site, "", journal_path)
+    assert summary["failed"] == 1
+    assert bulk_import.load_journal(journal_path)["Q42"]["status"] == "failed"
+    assert id_mapping.get_mapping_store().get_tracked("repo") == {}
+
+    results.append(True)
+    summary = bulk_import.bulk_import(["Q42"], site, site, "", journal_path)
+    assert batches == [["Q42"], ["Q42"]]
+    assert summary["items"] == 1
+    entry = bulk_import.load_journal(journal_path)["Q42"]
+    assert entry["status"] == "done"
+    assert entry["local_id"] == "Q1000"
+    assert id_mapping.get_mapping_store().get_tracked("repo") == {"Q42": 100}
+
+    summary = bulk_import.bulk_import(["Q42"], site, site, "", journal_path)
+    assert summary["skipped"] == 1
+    assert len(batches) == 2
+
+
+def test_dump_import_prefetches_per_batch(monkeypatch, tmp_path):
+    store = id_mapping.MappingStore(tmp_path / "id_mapping.sqlite3")
+    monkeypatch.setattr(id_mapping, "mapping_store", store)
+
+    # Q1 uses Q2, which is in the same batch, and Q10, which is not in the dump
+    references = {"Q1": ["Q2", "Q10"], "Q2": ["Q10"], "Q3": ["Q11"]}
+    dump_path = tmp_path / "dump.json"
+    dump_path.write_text(
+        "[\n"
+        + ",\n".join(f'{{"type":"item","id":"{qid}"}}' for qid in references)
+        + "\n]\n"
+    )
+
+    loads = []
+
+    def load_items(site, qids, max_workers=None):
+        if qids:
+            loads.append(sorted(qids))
+        return [FakeItemPage(site, qid) for qid in qids]
+
+    def import_item(qid, site, local_site, local_site_url, **kwargs):
+        assert set(references[qid]) <= kwargs["entity_cache"].keys()
+        return {"id": "L" + qid, "api_calls": {"edits": 1, "total": 1}}
+
+    monkeypatch.setattr(
+        bulk_import.wikidata_dump,
+        "create_item_from_entity",
+        lambda repo, entity: FakeItemPage(repo, entity["id"]),
+    )
+    monkeypatch.setattr(wd, "load_items", load_items)
+    monkeypatch.setattr(
+        wd, "get_ids_for_item", lambda item, *args, **kwargs: references[item.id]
+    )
+    monkeypatch.setattr(iwr, "import_wikidata_item_to_local_wikibase", import_item)
+
+    site = FakeSite()
+    summary = bulk_import.bulk_import_from_dump(
+        dump_path, site, site, "", journal_path=tmp_path / "j.jsonl", batch_size=2
+    )
+    assert summary["items"] == 3
+    assert loads == [["Q10"], ["Q11"]]
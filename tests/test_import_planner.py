@@ -0,0 +1,68 @@
+import scripts.utils.bulk_import as bulk_import
+import scripts.utils.id_mapping as id_mapping
+import scripts.utils.import_planner as import_planner
+import scripts.utils.import_wikidata_records as iwr
+import scripts.utils.wikidata_utils as wd
+
+# Q1 uses Q2 and Q3, Q2 uses Q3, and Q3 uses Q4
+GRAPH = {"Q1": ["Q2", "Q3"], "Q2": ["Q3"], "Q3": ["Q4"], "Q4": []}
+
+
+class FakeItem:
+    def __init__(self, id):
+        self.id = id
+
+    def get(self):
+        return {"labels": {"en": self.id}}
+
+    def toJSON(self):
+        return {}
+
+
+class FakeSite:
+    def data_repository(self):
+        return "repo"
+
+
+def test_planned_items_are_not_loaded_again(monkeypatch, tmp_path):
+    store = id_mapping.MappingStore(tmp_path / "id_mapping.sqlite3")
+    monkeypatch.setattr(id_mapping, "mapping_store", store)
+
+    loads = []
+
+    def load_items(site, qids, max_workers=None):
+        if qids:
+            loads.append(sorted(qids))
+        return [FakeItem(qid) for qid in qids]
+
+    def get_ids_for_item(item, item_json, **kwargs):
+        return GRAPH[item.id]
+
+    def find_or_create_local_item(item_dict, local_site, local_repo, *args):
+        store.set(local_repo, args[-1], "L" + args[-1])
+
+    imported = []
+
+    def import_item(qid, site, local_site, local_site_url, **kwargs):
+        imported.append(qid)
+        assert set(GRAPH[qid]) <= kwargs["entity_cache"].keys()
+        store.set("repo", qid, "L" + qid)
+        return {"id": "L" + qid, "api_calls": {"edits": 1, "total": 1}}
+
+    monkeypatch.setattr(wd, "load_items", load_items)
+    monkeypatch.setattr(wd, "get_ids_for_item", get_ids_for_item)
+    monkeypatch.setattr(iwr, "find_or_create_local_item", find_or_create_local_item)
+    monkeypatch.setattr(iwr, "import_wikidata_item_to_local_wikibase", import_item)
+
+    site = FakeSite()
+    summary = import_planner.import_with_dependencies(
+        ["Q1"], site, site, "", depth=1, journal_path=tmp_path / "journal.jsonl"
+    )
+
+    assert loads == [["Q1"], ["Q2", "Q3"], ["Q4"]]
+    assert imported == ["Q3", "Q2", "Q1"]
+    assert store.get("repo", "Q4") == "LQ4"
+    assert summary["items"] == 3
+    assert (
+        bulk_import.load_journal(tmp_path / "journal.jsonl")["Q1"]["status"] == "done"
+    )
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import scripts.utils.import_wikidata_records as iwr
+import scripts.utils.item_diff as item_diff
+
+
+def make_snak(property, qid):
+    return {
+        "snaktype": "value",
+        "property": property,
+        "datavalue": {
+            "value": {"entity-type": "item", "numeric-id": int(qid[1:]), "id": qid},
+            "type": "wikibase-entityid",
+        },
+    }
+
+
+def make_statement(property, qid, id=None, rank="normal", qualifiers=None):
+    statement = {"mainsnak": make_snak(property, qid), "type": "statement"}
+    statement["rank"] = rank
+    if id:
+        statement["id"] = id
+    if qualifiers:
+        statement["qualifiers"] = {snak["property"]: [snak] for snak in qualifiers}
+    return statement
+
+
+LOCAL_CLAIMS = {
+    "P31": [make_statement("P31", "Q5", "L$1")],
+    "P1082": [make_statement("P1082", "Q10", "L$2")],
+}
+
+
+def test_removals_skip_incomplete_properties():
+    # the P1082 value could not be converted, so it is not in the statements
+    statements = [make_statement("P31", "Q5")]
+
+    changes = item_diff.diff_statements(statements, LOCAL_CLAIMS, True)
+    assert changes == [{"id": "L$2", "remove": ""}]
+
+    changes = item_diff.diff_statements(statements, LOCAL_CLAIMS, True, {"P1082"})
+    assert changes == []
+
+
+def test_incomplete_properties_keep_qualifiers():
+    local_claims = {
+        "P31": [make_statement("P31", "Q5", "L$1", qualifiers=[make_snak("P2", "Q9")])]
+    }
+    statements = [make_statement("P31", "Q5")]
+
+    changes = item_diff.diff_statements(statements, local_claims, True)
+    assert "qualifiers" not in changes[0]
+
+    changes = item_diff.diff_statements(statements, local_claims, True, {"P31"})
+    assert changes == []
+
+
+def test_rank_is_synced():
+    statements = [
+        make_statement("P31", "Q5", rank="preferred"),
+        make_statement("P1082", "Q10"),
+    ]
+
+    for allow_removals in [False, True]:
+        changes = item_diff.diff_statements(statements, LOCAL_CLAIMS, allow_removals)
+        assert len(changes) == 1
+        assert changes[0]["id"] == "L$1"
+        assert changes[0]["rank"] == "preferred"
+
+
+def make_claim(qualifiers=0, sources=()):
+    return SimpleNamespace(
+        qualifiers={"P2": [None] * qualifiers} if qualifiers else {},
+        sources=[{property: [None]} for property in sources],
+    )
+
+
+def test_get_incomplete_properties():
+    item_dict = {
+        "claims": {
+            "P31": [make_claim()],
+            "P1082": [make_claim(), make_claim()],
+            "P17": [make_claim(qualifiers=1)],
+            "P18": [make_claim(sources=["P248", "P854"])],
+        }
+    }
+    data = {
+        "claims": [
+            make_statement("P31", "Q5"),
+            make_statement("P1082", "Q10"),
+            make_statement("P17", "Q30"),
+            {
+                **make_statement("P18", "Q1"),
+                "references": [{"snaks": {"P248": [make_snak("P248", "Q2")]}}],
+            },
+        ]
+    }
+    assert iwr.get_incomplete_properties(item_dict, data) == {"P1082", "P17"}
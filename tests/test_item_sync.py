@@ -0,0 +1,25 @@
+import scripts.utils.id_mapping as id_mapping
+import scripts.utils.item_sync as item_sync
+import scripts.utils.wiki_queries as wq
+
+
+def test_redirected_items_are_synced_as_the_target(monkeypatch, tmp_path):
+    store = id_mapping.MappingStore(tmp_path / "id_mapping.sqlite3")
+    monkeypatch.setattr(id_mapping, "mapping_store", store)
+    store.set_many("repo", {"Q1": "Q101", "Q3": "Q103"})
+    store.track_many("repo", {"Q1": 10, "Q3": 30})
+
+    # Q1 was merged into Q2, Q3 did not change
+    entities = {
+        "Q2": {"id": "Q2", "lastrevid": 20, "redirects": {"from": "Q1", "to": "Q2"}},
+        "Q3": {"id": "Q3", "lastrevid": 30},
+    }
+    monkeypatch.setattr(wq, "fetch_and_format_entities", lambda *args: entities)
+
+    changed = item_sync.find_changed_items(None, "repo")
+    assert changed == {"Q2": 20}
+    assert store.get("repo", "Q2") == "Q101"
+    assert store.get_tracked("repo") == {"Q2": None, "Q3": 30}
+
+    store.track_many("repo", changed)
+    assert item_sync.find_changed_items(None, "repo") == {}
@@ -0,0 +1,37 @@
+from pywikibot.comms import http as pywikibot_http
+import requests
+
+import scripts.utils.call_ledger as call_ledger
+import scripts.utils.wiki_http as wh
+
+
+def test_pywikibot_requests_are_rate_limited(monkeypatch):
+    acquired = []
+
+    class FakeLimiter:
+        def __init__(self, host):
+            self.host = host
+
+        def acquire(self):
+            acquired.append(self.host)
+
+    def fetch(uri, *args, **kwargs):
+        response = requests.Response()
+        response._content = b"{}"
+        return response
+
+    # wrap a fake fetch, so no request is sent
+    monkeypatch.setattr(pywikibot_http, "fetch", fetch)
+    monkeypatch.setattr(wh, "get_rate_limiter", FakeLimiter)
+    wh.install_pywikibot_hook()
+
+    with call_ledger.call_ledger("test") as ledger:
+        pywikibot_http.fetch(
+            "https://www.wikidata.org/w/api.php",
+            method="POST",
+            data={"action": "wbeditentity"},
+        )
+        pywikibot_http.fetch("https://commons.wikimedia.org/w/api.php?action=query")
+
+    assert acquired == ["www.wikidata.org", "commons.wikimedia.org"]
+    assert ledger.totals()["edits"] == 1
@@ -0,0 +1,44 @@
+import json
+
+import scripts.utils.wiki_queries as wq
+
+FORMATTER_URLS = {"P214": "https://viaf.org/viaf/$1"}
+
+
+def test_formatter_url_index_is_built_on_first_use(monkeypatch, tmp_path):
+    path = tmp_path / "formatter_urls.json"
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return dict(FORMATTER_URLS)
+
+    monkeypatch.setattr(wq, "external_id_formatter_urls", None)
+    monkeypatch.setattr(wq, "fetch_and_format_external_id_formatter_urls", fetch)
+
+    assert wq.load_external_id_formatter_urls(path) == FORMATTER_URLS
+    assert wq.load_external_id_formatter_urls(path) == FORMATTER_URLS
+    assert len(calls) == 1
+    assert json.loads(path.read_text()) == FORMATTER_URLS
+
+    # a new process reads the saved index
+    monkeypatch.setattr(wq, "external_id_formatter_urls", None)
+    assert wq.load_external_id_formatter_urls(path) == FORMATTER_URLS
+    assert len(calls) == 1
+
+
+def test_formatter_url_index_falls_back_when_it_can_not_be_built(monkeypatch, tmp_path):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(wq, "external_id_formatter_urls", None)
+    monkeypatch.setattr(wq, "fetch_and_format_external_id_formatter_urls", fetch)
+
+    path = tmp_path / "formatter_urls.json"
+    assert wq.load_external_id_formatter_urls(path) == {}
+    assert wq.load_external_id_formatter_urls(path) == {}
+    assert len(calls) == 1
+    assert not path.exists()